@@ -1,17 +1,32 @@
 from __future__ import annotations
 
+import time
+
 import Strategy
+from Resources import Resources
 
 
 class Context:
 
     def __init__(self) -> None:
         self._strategies = []
+        self._resources = Resources()
 
     def append_strategy(self, strategy: Strategy) -> None:
+        strategy.set_resources(self._resources)
         self._strategies.append(strategy)
 
     def run_strategies(self) -> None:
         print('Running strategies:', self._strategies)
-        for strategy in self._strategies:
+        run_times = []
+        for i, strategy in enumerate(self._strategies):
+            name = str(i) + ' ' + type(strategy).__name__
+            self._resources.begin(name)
+            start_time = time.time()
             strategy.do_algorithm()
+            run_times.append((name, time.time() - start_time))
+
+        print('strategy, load time [s], compute time [s]')
+        for name, run_time in run_times:
+            load_time = self._resources.load_times[name]
+            print(name, load_time, run_time - load_time)
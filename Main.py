@@ -16,6 +16,7 @@ import selection.LocalOptimality as lopt
 import selection.MinPeaks as minp
 import selection.Skyline as skyline
 import selection.DiversityStrat as diversity
+import selection.FusedSelection as fused
 import selection.SelectAllStrat as all
 from Context import Context
 
@@ -38,6 +39,8 @@ if __name__ == "__main__":
     parser.add_argument("-ds", "--dataset", help="work directory.", default='porto_small')
     parser.add_argument("-d", "--directory", help="work directory.", type=dir_path, default=None)
     parser.add_argument("-tf", "--train-file", help="train file.", default=None)
+    parser.add_argument("-w", "--workers", help="number of worker processes for trip-parallel strategies.", type=int,
+                        default=None)
     parser.add_argument("-osm", "--openstreetmaps", help="download and prepare openstreetmaps data",
                         action="store_true")
     parser.add_argument("-fmm", "--fastmapmatching", help="run fastmapmatching", action="store_true")
@@ -45,6 +48,7 @@ if __name__ == "__main__":
     parser.add_argument("-sp", "--shortestpath", help="run shortest path", action="store_true")
     parser.add_argument("-fp", "--fastestpath", help="run fastest path", action="store_true")
     parser.add_argument("-rc", "--resource-constrained", help="run resource constrained", action="store_true")
+    parser.add_argument("-kspd", "--kspd", help="run k-shortest paths with duration bounds, input of the -kspd-* strategies", action="store_true")
     parser.add_argument("-vp", "--via-paths", help="run via paths", action="store_true")
     parser.add_argument("-pen", "--penalty", help="run penalty strategy", action="store_true")
 
@@ -80,6 +84,13 @@ if __name__ == "__main__":
     parser.add_argument("-batch-30-lopt", "--batch-30-local-optimality", help="run local optimality strategy on batch-30 results.", action="store_true")
     parser.add_argument("-batch-60-lopt", "--batch-60-local-optimality", help="run local optimality strategy on batch-60 results.", action="store_true")
 
+    parser.add_argument("-svp-div", "--svp-diversity", help="run diversity strategy with the thresholds from conf.ini on svp results.", action="store_true")
+    parser.add_argument("-pen-div", "--pen-diversity", help="run diversity strategy with the thresholds from conf.ini on pen results.", action="store_true")
+    parser.add_argument("-kspd-div", "--kspd-diversity", help="run diversity strategy with the thresholds from conf.ini on kspd results.", action="store_true")
+    parser.add_argument("-batch-15-div", "--batch-15-diversity", help="run diversity strategy with the thresholds from conf.ini on batch-15 results.", action="store_true")
+    parser.add_argument("-batch-30-div", "--batch-30-diversity", help="run diversity strategy with the thresholds from conf.ini on batch-30 results.", action="store_true")
+    parser.add_argument("-batch-60-div", "--batch-60-diversity", help="run diversity strategy with the thresholds from conf.ini on batch-60 results.", action="store_true")
+
     parser.add_argument("-svp-div-10", "--svp-diversity-10", help="run diversity strategy with 10 percent threshold on svp results.", action="store_true")
     parser.add_argument("-pen-div-10", "--pen-diversity-10", help="run diversity strategy with 10 percent threshold on pen results.", action="store_true")
     parser.add_argument("-kspd-div-10", "--kspd-diversity-10", help="run diversity strategy with 10 percent threshold on kspd results.", action="store_true")
@@ -124,6 +135,8 @@ if __name__ == "__main__":
         config['DEFAULT']['base_path'] = args.directory
     if args.train_file is not None:
         config['DEFAULT']['train_file_name'] = args.train_file
+    if args.workers is not None:
+        config['parallel']['workers'] = str(args.workers)
 
     print('dataset:', config['DEFAULT']['dataset'])
     print('base path:', config['DEFAULT']['base_path'])
@@ -141,6 +154,8 @@ if __name__ == "__main__":
         context.append_strategy(sp.ShortestPathStrat(config, fastest=True))
     if args.resource_constrained:
         context.append_strategy(rc.ResourceConstrainedStrat(config))
+    if args.kspd:
+        context.append_strategy(rc.ResourceConstrainedStrat(config, 'kspd'))
     if args.via_paths:
         context.append_strategy(vp.ViaPathsStrat(config))
     if args.penalty:
@@ -152,96 +167,79 @@ if __name__ == "__main__":
     if args.batch_60:
         context.append_strategy(bs.BatchStrat(config, '60'))
 
+    # selection strategies are collected first, so the ones on the same input method can share a single pass
+    selectors = []
     if args.svp_all:
-        context.append_strategy(all.SelectAllStrat(config, 'vp'))
+        selectors.append(all.SelectAllStrat(config, 'vp'))
     if args.pen_all:
-        context.append_strategy(all.SelectAllStrat(config, 'pen'))
+        selectors.append(all.SelectAllStrat(config, 'pen'))
     if args.kspd_all:
-        context.append_strategy(all.SelectAllStrat(config, 'kspd'))
+        selectors.append(all.SelectAllStrat(config, 'kspd'))
     if args.batch_15_all:
-        context.append_strategy(all.SelectAllStrat(config, 'batch-15'))
+        selectors.append(all.SelectAllStrat(config, 'batch-15'))
     if args.batch_30_all:
-        context.append_strategy(all.SelectAllStrat(config, 'batch-30'))
+        selectors.append(all.SelectAllStrat(config, 'batch-30'))
     if args.batch_60_all:
-        context.append_strategy(all.SelectAllStrat(config, 'batch-60'))
+        selectors.append(all.SelectAllStrat(config, 'batch-60'))
 
     if args.svp_min_peaks:
-        context.append_strategy(minp.MinPeaksStrat(config, 'vp'))
+        selectors.append(minp.MinPeaksStrat(config, 'vp'))
     if args.pen_min_peaks:
-        context.append_strategy(minp.MinPeaksStrat(config, 'pen'))
+        selectors.append(minp.MinPeaksStrat(config, 'pen'))
     if args.kspd_min_peaks:
-        context.append_strategy(minp.MinPeaksStrat(config, 'kspd'))
+        selectors.append(minp.MinPeaksStrat(config, 'kspd'))
     if args.batch_15_min_peaks:
-        context.append_strategy(minp.MinPeaksStrat(config, 'batch-15'))
+        selectors.append(minp.MinPeaksStrat(config, 'batch-15'))
     if args.batch_30_min_peaks:
-        context.append_strategy(minp.MinPeaksStrat(config, 'batch-30'))
+        selectors.append(minp.MinPeaksStrat(config, 'batch-30'))
     if args.batch_30_min_peaks:
-        context.append_strategy(minp.MinPeaksStrat(config, 'batch-60'))
+        selectors.append(minp.MinPeaksStrat(config, 'batch-60'))
 
     if args.svp_skyline:
-        context.append_strategy(skyline.SkylineStrat(config, 'vp'))
+        selectors.append(skyline.SkylineStrat(config, 'vp'))
     if args.pen_skyline:
-        context.append_strategy(skyline.SkylineStrat(config, 'pen'))
+        selectors.append(skyline.SkylineStrat(config, 'pen'))
     if args.kspd_skyline:
-        context.append_strategy(skyline.SkylineStrat(config, 'kspd'))
+        selectors.append(skyline.SkylineStrat(config, 'kspd'))
     if args.batch_15_skyline:
-        context.append_strategy(skyline.SkylineStrat(config, 'batch-15'))
+        selectors.append(skyline.SkylineStrat(config, 'batch-15'))
     if args.batch_30_skyline:
-        context.append_strategy(skyline.SkylineStrat(config, 'batch-30'))
+        selectors.append(skyline.SkylineStrat(config, 'batch-30'))
     if args.batch_60_skyline:
-        context.append_strategy(skyline.SkylineStrat(config, 'batch-60'))
+        selectors.append(skyline.SkylineStrat(config, 'batch-60'))
 
     if args.svp_local_optimality:
-        context.append_strategy(lopt.LocalOptimalityStrat(config, 'vp'))
+        selectors.append(lopt.LocalOptimalityStrat(config, 'vp'))
     if args.pen_local_optimality:
-        context.append_strategy(lopt.LocalOptimalityStrat(config, 'pen'))
+        selectors.append(lopt.LocalOptimalityStrat(config, 'pen'))
     if args.kspd_local_optimality:
-        context.append_strategy(lopt.LocalOptimalityStrat(config, 'kspd'))
+        selectors.append(lopt.LocalOptimalityStrat(config, 'kspd'))
     if args.batch_15_local_optimality:
-        context.append_strategy(lopt.LocalOptimalityStrat(config, 'batch-15'))
+        selectors.append(lopt.LocalOptimalityStrat(config, 'batch-15'))
     if args.batch_30_local_optimality:
-        context.append_strategy(lopt.LocalOptimalityStrat(config, 'batch-30'))
+        selectors.append(lopt.LocalOptimalityStrat(config, 'batch-30'))
     if args.batch_60_local_optimality:
-        context.append_strategy(lopt.LocalOptimalityStrat(config, 'batch-60'))
-
-    if args.svp_diversity_10:
-        context.append_strategy(diversity.DiversityStrat(config, 'vp', .1))
-    if args.pen_diversity_10:
-        context.append_strategy(diversity.DiversityStrat(config, 'pen', .1))
-    if args.kspd_diversity_10:
-        context.append_strategy(diversity.DiversityStrat(config, 'kspd', .1))
-    if args.batch_15_diversity_10:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-15', .1))
-    if args.batch_30_diversity_10:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-30', .1))
-    if args.batch_60_diversity_10:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-60', .1))
-
-    if args.svp_diversity_30:
-        context.append_strategy(diversity.DiversityStrat(config, 'vp', .3))
-    if args.pen_diversity_30:
-        context.append_strategy(diversity.DiversityStrat(config, 'pen', .3))
-    if args.kspd_diversity_30:
-        context.append_strategy(diversity.DiversityStrat(config, 'kspd', .3))
-    if args.batch_15_diversity_30:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-15', .3))
-    if args.batch_30_diversity_30:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-30', .3))
-    if args.batch_60_diversity_30:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-60', .3))
-
-    if args.svp_diversity_70:
-        context.append_strategy(diversity.DiversityStrat(config, 'vp', .7))
-    if args.pen_diversity_70:
-        context.append_strategy(diversity.DiversityStrat(config, 'pen', .7))
-    if args.kspd_diversity_70:
-        context.append_strategy(diversity.DiversityStrat(config, 'kspd', .7))
-    if args.batch_15_diversity_70:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-15', .7))
-    if args.batch_30_diversity_70:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-30', .7))
-    if args.batch_60_diversity_70:
-        context.append_strategy(diversity.DiversityStrat(config, 'batch-60', .7))
+        selectors.append(lopt.LocalOptimalityStrat(config, 'batch-60'))
+
+    # all diversity thresholds of an input method are selected in a single pass
+    config_thresholds = diversity.parse_thresholds(config['div']['thresholds'])
+    for input_method, arg_name in [('vp', 'svp'), ('pen', 'pen'), ('kspd', 'kspd'), ('batch-15', 'batch_15'),
+                                   ('batch-30', 'batch_30'), ('batch-60', 'batch_60')]:
+        thresholds = config_thresholds if getattr(args, arg_name + '_diversity') else []
+        for threshold in (.1, .3, .7):
+            if getattr(args, arg_name + '_diversity_' + str(round(threshold * 100))) and threshold not in thresholds:
+                thresholds = thresholds + [threshold]
+        if thresholds:
+            selectors.append(diversity.DiversityStrat(config, input_method, thresholds))
+
+    selectors_by_input_method = {}
+    for selector in selectors:
+        selectors_by_input_method.setdefault(selector.input_method, []).append(selector)
+    for input_method, group in selectors_by_input_method.items():
+        if len(group) == 1:
+            context.append_strategy(group[0])
+        else:
+            context.append_strategy(fused.FusedSelectionStrat(config, input_method, group))
 
     if args.evaluate_shortest_path:
         context.append_strategy(esp.SinglePathEvaluatorStrat(config, 'eval-sp'))
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import time
+
+import networkx as nx
+
+from evaluation import GroundTruth
+from util import GraphSnapshot
+from util.CompactGraph import CompactGraph
+
+# resources shared by all registries of this process, so each one is built at most once
+_cache = {}
+
+
+class Resources:
+    """
+    Lazily loaded graphs and indices shared by the strategies of a Context.
+
+    Strategies request resources by graphml path and weight instead of loading them themselves. The time spent
+    loading is booked on the strategy that first requested a resource, so run times can be split into load and
+    compute time.
+    """
+
+    def __init__(self) -> None:
+        self._current = None
+        self._depth = 0
+        self.load_times = {}
+
+    def begin(self, name: str) -> None:
+        self._current = name
+        self.load_times.setdefault(name, 0.0)
+
+    def _get(self, key: tuple, build):
+        resource = _cache.get(key)
+        if resource is None:
+            start_time = time.time()
+            # resources built from other resources must not be booked twice
+            self._depth += 1
+            try:
+                resource = build()
+            finally:
+                self._depth -= 1
+            _cache[key] = resource
+            if self._current is not None and self._depth == 0:
+                self.load_times[self._current] += time.time() - start_time
+        return resource
+
+    def compact_graph(self, graphml_file_path: str, weight: str = 'length') -> CompactGraph:
+        return self._get(('compact_graph', graphml_file_path, weight),
+                         lambda: GraphSnapshot.load_compact_graph(graphml_file_path, weight))
+
+    def digraph(self, graphml_file_path: str, weight: str = 'length') -> nx.DiGraph:
+        return self._get(('digraph', graphml_file_path, weight),
+                         lambda: self.compact_graph(graphml_file_path, weight).to_digraph())
+
+    def ground_truth(self, G: nx.DiGraph, ground_truth_file: str, graphml_file_path: str,
+                     cache_path: str, strict: bool = False) -> GroundTruth.GroundTruth:
+        # GroundTruth checks the train file and graphml itself, so only the time is tracked here
+        start_time = time.time()
+        gt = GroundTruth.load_ground_truth(G, ground_truth_file, graphml_file_path, cache_path, strict)
+        if self._current is not None and self._depth == 0:
+            self.load_times[self._current] += time.time() - start_time
+        return gt
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 
+from Resources import Resources
+
 
 class Strategy(ABC):
     """
@@ -12,6 +14,18 @@ class Strategy(ABC):
     Strategies.
     """
 
+    _resources = None
+
+    @property
+    def resources(self) -> Resources:
+        # strategies run outside a Context get a registry of their own
+        if self._resources is None:
+            self._resources = Resources()
+        return self._resources
+
+    def set_resources(self, resources: Resources) -> None:
+        self._resources = resources
+
     @abstractmethod
     def do_algorithm(self):
         pass
@@ -1,53 +1,29 @@
 import argparse
-import ast
 import csv
-import datetime
 import os
 import sys
 
 import networkx as nx
 import numpy
 import osmnx as ox
-from sklearn.metrics import precision_score, recall_score
 
+from evaluation import GroundTruth
+from evaluation import Metrics
+from util import PathParser
 
-def calculate_groud_truth(G: nx.DiGraph, ground_truth_file):
+
+def calculate_groud_truth(G: nx.DiGraph, ground_truth_file, ground_truth: GroundTruth.GroundTruth = None,
+                          strict: bool = False):
+    if ground_truth is None:
+        ground_truth = GroundTruth.build_ground_truth(G, ground_truth_file, strict=strict)
     G_nodes = list(G.nodes)
 
-    tripIds = []
     gt_path_vectors = {}
-    gt_path_edges = {}
-    gt_path_lengths = {}
-    tripsTimestamps = {}
-    tripsErrors = {}
-    errorList = []
+    for tripId in ground_truth.trip_ids:
+        gt_path_vectors[tripId] = get_path_vector_from_edges(G_nodes, ground_truth.path_edges[tripId])
 
-    with open(ground_truth_file, newline='') as csvfile:
-        spamreader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-        for row in spamreader:
-            lst = ast.literal_eval(row['CPATH'])
-            tripId = int(row['TRIP_ID'])
-            gt_path_edges[tripId] = lst
-            try:
-                tripsTimestamps[int(row['TRIP_ID'])] = datetime.datetime.strptime(row['TIMESTAMP'], '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                tripsTimestamps[int(row['TRIP_ID'])] = datetime.datetime.fromtimestamp(int(row['TIMESTAMP']))
-            # print(tripId)
-            # for (a,b) in lst:
-            #    print("----- ",a,b)
-            #    print("----- length = ",G.edges[a,b]['length'])
-            gt_path_lengths[tripId] = get_path_length(G, lst)
-            gt_path_vectors[tripId] = get_path_vector_from_edges(G_nodes, lst)
-            tripIds.append(tripId)
-            try:
-                tripsTimestamps[tripId] = datetime.datetime.strptime(row['TIMESTAMP'], '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                tripsTimestamps[tripId] = datetime.datetime.fromtimestamp(int(row['TIMESTAMP']))
-            dist = nx.dijkstra_path_length(G, int(row['START_NODE']), int(row['END_NODE']), weight='weight_duration')
-            tripsErrors[tripId] = float(row['REAL_DURATION']) - dist
-            errorList.append(abs(float(row['REAL_DURATION']) - dist))
-
-    return tripIds, gt_path_vectors, gt_path_edges, gt_path_lengths, tripsTimestamps, tripsErrors, errorList
+    return (ground_truth.trip_ids, gt_path_vectors, ground_truth.path_edges, ground_truth.path_lengths,
+            ground_truth.timestamps, ground_truth.errors, ground_truth.error_list)
 
 
 def get_path_vector_from_nodes(G_nodes, path_nodes):
@@ -116,7 +92,7 @@ def load_precisions(base_dir: str):
     return precision, recall, recall_at_n, accuracy
 
 
-def load_node_set_size(base_dir: str):
+def load_node_set_size(base_dir: str, strict: bool = False):
     csv.field_size_limit(sys.maxsize)
     node_set_size = {}
 
@@ -129,7 +105,7 @@ def load_node_set_size(base_dir: str):
                 if 'NODE_SET' in row and row['NODE_SET'] == 'set()':
                     print(trip_id, 'skipping, empty node set!')
                     continue
-                node_set_size[trip_id] = len(ast.literal_eval(row['NODE_SET']))
+                node_set_size[trip_id] = len(PathParser.parse_int_set(row['NODE_SET'], strict))
     return node_set_size
 
 
@@ -150,17 +126,16 @@ def load_stat_file(file_name: str) -> dict:
         return stats
 
 
-def get_stats_single_file(G, ground_truth_file, result_file) -> tuple:
-    (tripIds, gt_path_vectors, gt_path_edges, gt_path_lengths, tripsTimestamps, tripsErrors,
-     errorList) = calculate_groud_truth(G, ground_truth_file)
-    total_rows = len(tripIds)
+def get_stats_single_file(G, ground_truth_file, result_file, ground_truth: GroundTruth.GroundTruth = None,
+                          strict: bool = False) -> tuple:
+    if ground_truth is None:
+        ground_truth = GroundTruth.build_ground_truth(G, ground_truth_file, strict=strict)
+    total_rows = len(ground_truth.trip_ids)
 
-    G_nodes = list(G.nodes)
+    G_nodes = set(G.nodes)
 
     precisions = {}
     recalls = {}
-    recallsATn = {}
-    accuracies = {}
 
     csv.field_size_limit(sys.maxsize)
     with open(result_file, newline='') as csvfile:
@@ -170,33 +145,21 @@ def get_stats_single_file(G, ground_truth_file, result_file) -> tuple:
             tripId = int(row['TRIP_ID'])
             print(i / total_rows * 100, '%; trip_id: ', tripId)
             i += 1
-            pathNodes = ast.literal_eval(row['NODE_SET'])
-            tempVector = get_path_vector_from_nodes(G_nodes, pathNodes)
-
-            precisions[tripId] = precision_score(gt_path_vectors[tripId], tempVector)
-            recalls[tripId] = recall_score(gt_path_vectors[tripId], tempVector)
-
-            # pathLength = 0
-            # intersectionLength = 0
-            # for i in range(0, len(pathNodes) - 1):
-            #     e = (pathNodes[i], pathNodes[i + 1])
-            #     pathLength += G.edges[e[0], e[1]]['length']
-            #     if e in gt_path_edges[tripId]:
-            #         intersectionLength += G.edges[e[0], e[1]]['length']
-            #
-            # recallsATn[tripId] = intersectionLength / gt_path_lengths[tripId]
-            # accuracies[tripId] = intersectionLength / max(gt_path_lengths[tripId], pathLength)
+            pathNodes = PathParser.parse_int_set(row['NODE_SET'], strict).tolist()
+
+            precisions[tripId], recalls[tripId] = Metrics.precision_recall(ground_truth.path_nodes(tripId),
+                                                                           pathNodes, universe=G_nodes)
     return precisions, recalls
 
 
-def get_stats_multi_file(G: list, ground_truth_dir, result_dir) -> tuple:
+def get_stats_multi_file(G: list, ground_truth_dir, result_dir, strict: bool = False) -> tuple:
     precisions = {}
     recalls = {}
 
     for filename in os.listdir(result_dir):
         ground_truth_file = os.path.join(ground_truth_dir, filename)
         result_file = os.path.join(result_dir, filename)
-        p, r = get_stats_single_file(G, ground_truth_file, result_file)
+        p, r = get_stats_single_file(G, ground_truth_file, result_file, strict=strict)
         precisions |= p
         recalls |= r
 
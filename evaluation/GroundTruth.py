@@ -0,0 +1,122 @@
+import csv
+import datetime
+import os
+import pickle
+import sys
+
+import networkx as nx
+
+from util import PathParser
+
+# bump this whenever the layout of the pickled index changes
+_CACHE_VERSION = 1
+
+# ground truth indices already loaded by this process, keyed by cache file
+_loaded = {}
+
+
+class GroundTruth:
+    """
+    Map-matched ground truth of a train file, keyed by trip id.
+
+    The index is built once from the fmm output and persisted to the cache dir, so selection and evaluation
+    strategies don't have to re-parse the train file and re-run a Dijkstra for every trip.
+    """
+
+    def __init__(self, signature: tuple) -> None:
+        self.signature = signature
+        self.trip_ids = []
+        self.path_edges = {}
+        self.path_lengths = {}
+        self.timestamps = {}
+        self.errors = {}
+        self.error_list = []
+
+    def path_nodes(self, trip_id: int) -> set:
+        node_set = set()
+        for (a, b) in self.path_edges[trip_id]:
+            node_set.add(a)
+            node_set.add(b)
+        return node_set
+
+
+def _file_signature(file_path: str) -> tuple:
+    stat = os.stat(file_path)
+    return os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def _parse_timestamp(timestamp: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return datetime.datetime.fromtimestamp(int(timestamp))
+
+
+def build_ground_truth(G: nx.DiGraph, ground_truth_file: str, signature: tuple = None,
+                       strict: bool = False) -> GroundTruth:
+    csv.field_size_limit(sys.maxsize)
+    gt = GroundTruth(signature)
+
+    with open(ground_truth_file, newline='') as csvfile:
+        spamreader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+        for row in spamreader:
+            lst = [(a, b) for a, b in PathParser.parse_int_pairs(row['CPATH'], strict).tolist()]
+            trip_id = int(row['TRIP_ID'])
+
+            length = 0
+            for (a, b) in lst:
+                length += G.edges[a, b]['length']
+
+            gt.trip_ids.append(trip_id)
+            gt.path_edges[trip_id] = lst
+            gt.path_lengths[trip_id] = length
+            gt.timestamps[trip_id] = _parse_timestamp(row['TIMESTAMP'])
+
+            dist = nx.dijkstra_path_length(G, int(row['START_NODE']), int(row['END_NODE']), weight='weight_duration')
+            gt.errors[trip_id] = float(row['REAL_DURATION']) - dist
+            gt.error_list.append(abs(float(row['REAL_DURATION']) - dist))
+
+    return gt
+
+
+def load_ground_truth(G: nx.DiGraph, ground_truth_file: str, graphml_file_path: str, cache_path: str,
+                      strict: bool = False) -> GroundTruth:
+    """
+    Return the ground truth index for the given train file.
+
+    The index is read from the cache dir if it was built from the same train file and graphml with the same
+    parsing mode, otherwise it is rebuilt and written back. Within a process every index is loaded at most once.
+    """
+    signature = (_CACHE_VERSION, _file_signature(ground_truth_file), _file_signature(graphml_file_path), strict)
+    cache_file_path = os.path.join(cache_path, os.path.basename(ground_truth_file) + '.pickle')
+
+    gt = _loaded.get(cache_file_path)
+    if gt is not None and gt.signature == signature:
+        return gt
+
+    gt = None
+    if os.path.exists(cache_file_path):
+        with open(cache_file_path, 'rb') as cache_file:
+            try:
+                gt = pickle.load(cache_file)
+            except (pickle.UnpicklingError, EOFError, AttributeError):
+                print('Ground truth cache is corrupt, rebuilding:', cache_file_path)
+        if gt is not None and gt.signature != signature:
+            print('Ground truth cache is stale, rebuilding:', cache_file_path)
+            gt = None
+
+    if gt is None:
+        print('Building ground truth index:', ground_truth_file)
+        gt = build_ground_truth(G, ground_truth_file, signature, strict)
+
+        if not os.path.exists(cache_path):
+            print("Creating cache directory: ", cache_path)
+            os.makedirs(cache_path)
+        # write to a temporary file first so an interrupted run never leaves a truncated cache behind
+        tmp_file_path = cache_file_path + '.tmp'
+        with open(tmp_file_path, 'wb') as cache_file:
+            pickle.dump(gt, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file_path, cache_file_path)
+
+    _loaded[cache_file_path] = gt
+    return gt
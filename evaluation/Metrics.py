@@ -0,0 +1,169 @@
+import numpy as np
+
+
+# Sparse replacements for the |V|-length 0/1 node vectors that were scored with sklearn's
+# precision_score/recall_score. A node vector only contains the nodes of the graph, so nodes outside the
+# optional universe are ignored. An empty denominator gives 0.0, the same as sklearn's zero_division default.
+
+
+def _ratio(numerator, denominator) -> float:
+    if denominator == 0:
+        return 0.0
+    return numerator / denominator
+
+
+def precision_recall(gt_nodes, pred_nodes, universe=None) -> (float, float):
+    """
+    Precision and recall of the predicted nodes against the ground truth nodes.
+
+    Nodes can be given as sets (or any iterable) or as sorted int arrays of unique node ids.
+    """
+    if isinstance(gt_nodes, np.ndarray) and isinstance(pred_nodes, np.ndarray):
+        if universe is not None:
+            gt_nodes = gt_nodes[np.isin(gt_nodes, universe, assume_unique=True)]
+            pred_nodes = pred_nodes[np.isin(pred_nodes, universe, assume_unique=True)]
+        tp = len(np.intersect1d(gt_nodes, pred_nodes, assume_unique=True))
+        return _ratio(tp, len(pred_nodes)), _ratio(tp, len(gt_nodes))
+
+    gt_nodes = set(gt_nodes)
+    pred_nodes = set(pred_nodes)
+    if universe is not None:
+        gt_nodes &= universe
+        pred_nodes &= universe
+    tp = len(gt_nodes & pred_nodes)
+    return _ratio(tp, len(pred_nodes)), _ratio(tp, len(gt_nodes))
+
+
+def overlap_length(gt_edges: set, pred_edges, pred_edge_lengths) -> (float, float):
+    """
+    Length of the predicted edges that are part of the ground truth, and the length of all predicted edges.
+
+    Lengths are summed in the order the edges are given, so results are identical to a plain loop.
+    """
+    intersection_length = 0
+    path_length = 0
+    for e, length in zip(pred_edges, pred_edge_lengths):
+        path_length += length
+        if e in gt_edges:
+            intersection_length += length
+    return intersection_length, path_length
+
+
+def recall_at_n_accuracy(intersection_length, path_length, gt_length) -> (float, float):
+    recall_at_n = intersection_length / gt_length
+    accuracy = intersection_length / max(gt_length, path_length)
+    return recall_at_n, accuracy
+
+
+def score(gt_nodes, pred_nodes, gt_edges: set, pred_edges, pred_edge_lengths, gt_length,
+          universe=None) -> (float, float, float, float):
+    """
+    Precision, recall, recall@n and accuracy of a single prediction.
+    """
+    precision, recall = precision_recall(gt_nodes, pred_nodes, universe)
+    intersection_length, path_length = overlap_length(gt_edges, pred_edges, pred_edge_lengths)
+    recall_at_n, accuracy = recall_at_n_accuracy(intersection_length, path_length, gt_length)
+    return precision, recall, recall_at_n, accuracy
+
+
+def _flatten(arrays: list, width: int) -> (np.ndarray, np.ndarray):
+    # concatenate per trip arrays and remember which trip each row belongs to
+    arrays = [np.asarray(a, dtype=np.int64).reshape(-1, width) for a in arrays]
+    sizes = np.array([len(a) for a in arrays], dtype=np.int64)
+    trip_index = np.repeat(np.arange(len(arrays), dtype=np.int64), sizes)
+    if len(arrays) == 0:
+        return trip_index, np.empty((0, width), dtype=np.int64)
+    return trip_index, np.concatenate(arrays)
+
+
+def _group_starts(columns: list) -> np.ndarray:
+    # rows are sorted; a row starts a new group if any column differs from the previous row
+    starts = np.ones(len(columns[0]), dtype=bool)
+    if len(columns[0]) > 1:
+        starts[1:] = np.any([c[1:] != c[:-1] for c in columns], axis=0)
+    return starts
+
+
+def _unique_rows(trip_index: np.ndarray, values: np.ndarray) -> (np.ndarray, np.ndarray):
+    columns = [trip_index] + [values[:, i] for i in range(values.shape[1])]
+    order = np.lexsort(columns[::-1])
+    sorted_columns = [c[order] for c in columns]
+    starts = _group_starts(sorted_columns)
+    return trip_index[order][starts], values[order][starts]
+
+
+def _batch_precision_recall(gt_nodes: list, pred_nodes: list, universe) -> (np.ndarray, np.ndarray):
+    num_trips = len(gt_nodes)
+    gt_trip, gt_flat = _unique_rows(*_flatten(gt_nodes, 1))
+    pred_trip, pred_flat = _unique_rows(*_flatten(pred_nodes, 1))
+    gt_flat = gt_flat[:, 0]
+    pred_flat = pred_flat[:, 0]
+
+    if universe is not None:
+        gt_mask = np.isin(gt_flat, universe)
+        gt_trip, gt_flat = gt_trip[gt_mask], gt_flat[gt_mask]
+        pred_mask = np.isin(pred_flat, universe)
+        pred_trip, pred_flat = pred_trip[pred_mask], pred_flat[pred_mask]
+
+    # after concatenating two sets of unique rows, every duplicate row is a true positive
+    trip = np.concatenate([gt_trip, pred_trip])
+    node = np.concatenate([gt_flat, pred_flat])
+    order = np.lexsort((node, trip))
+    trip, node = trip[order], node[order]
+    duplicates = (trip[1:] == trip[:-1]) & (node[1:] == node[:-1])
+
+    tp = np.bincount(trip[1:][duplicates], minlength=num_trips)
+    gt_count = np.bincount(gt_trip, minlength=num_trips)
+    pred_count = np.bincount(pred_trip, minlength=num_trips)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(pred_count > 0, tp / pred_count, 0.0)
+        recall = np.where(gt_count > 0, tp / gt_count, 0.0)
+    return precision, recall
+
+
+def _batch_overlap_length(gt_edges: list, pred_edges: list, pred_edge_lengths: list) -> (np.ndarray, np.ndarray):
+    num_trips = len(gt_edges)
+    gt_trip, gt_flat = _unique_rows(*_flatten(gt_edges, 2))
+    pred_trip, pred_flat = _flatten(pred_edges, 2)
+    pred_lengths = np.concatenate([np.asarray(lengths, dtype=np.float64) for lengths in pred_edge_lengths]) \
+        if num_trips > 0 else np.empty(0, dtype=np.float64)
+
+    # sort ground truth and predicted edges together; ground truth rows come first within each (trip, u, v)
+    # group, so a predicted edge is part of the ground truth if its group starts with a ground truth row
+    trip = np.concatenate([gt_trip, pred_trip])
+    u = np.concatenate([gt_flat[:, 0], pred_flat[:, 0]])
+    v = np.concatenate([gt_flat[:, 1], pred_flat[:, 1]])
+    is_pred = np.concatenate([np.zeros(len(gt_trip), dtype=np.int64), np.ones(len(pred_trip), dtype=np.int64)])
+    order = np.lexsort((is_pred, v, u, trip))
+
+    starts = _group_starts([trip[order], u[order], v[order]])
+    group_id = np.cumsum(starts) - 1
+    group_has_gt = is_pred[order][starts] == 0
+
+    in_gt = np.empty(len(order), dtype=bool)
+    in_gt[order] = group_has_gt[group_id]
+    in_gt = in_gt[len(gt_trip):]
+
+    # bincount accumulates the weights in array order, which keeps the sums identical to overlap_length
+    intersection_length = np.bincount(pred_trip[in_gt], weights=pred_lengths[in_gt], minlength=num_trips)
+    path_length = np.bincount(pred_trip, weights=pred_lengths, minlength=num_trips)
+    return intersection_length, path_length
+
+
+def score_batch(gt_nodes: list, pred_nodes: list, gt_edges: list, pred_edges: list, pred_edge_lengths: list,
+                gt_lengths, universe=None) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    """
+    Score many trips at once.
+
+    All arguments are lists with one entry per trip: node ids, (u, v) edge pairs and the lengths of the
+    predicted edges. universe is an optional array of all graph node ids. Returns arrays of precision, recall,
+    recall@n and accuracy in trip order, with the same values score() gives for every single trip.
+    """
+    precision, recall = _batch_precision_recall(gt_nodes, pred_nodes, universe)
+    intersection_length, path_length = _batch_overlap_length(gt_edges, pred_edges, pred_edge_lengths)
+
+    gt_lengths = np.asarray(gt_lengths, dtype=np.float64)
+    recall_at_n = intersection_length / gt_lengths
+    accuracy = intersection_length / np.maximum(gt_lengths, path_length)
+    return precision, recall, recall_at_n, accuracy
@@ -1,7 +1,6 @@
 import configparser
 import os
 
-import osmnx as ox
 from Strategy import Strategy
 
 from evaluation import EvalUtil
@@ -20,13 +19,17 @@ class MultiFileEvaluatorStrat(Strategy):
         self._train_file_path = os.path.join(fmm_output_path, train_file_name)
         self._output_file_path = os.path.join(self._output_path, train_file_name)
         self._graphml_file_path = config['osm']['graphml_file_path']
+        self._ground_truth_cache_path = config['eval-gt']['cache_path']
+        self._strict_parsing = config['DEFAULT'].getboolean('strict_parsing')
 
     def do_algorithm(self) -> None:
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.get_digraph(G, weight='length')
+        G = self.resources.digraph(self._graphml_file_path, weight='length')
 
+        gt = self.resources.ground_truth(G, self._train_file_path, self._graphml_file_path,
+                                         self._ground_truth_cache_path, self._strict_parsing)
         precisions, recalls = EvalUtil.get_stats_single_file(G, self._train_file_path,
-                                                             self._input_method_output_file_path)
+                                                             self._input_method_output_file_path, gt,
+                                                             self._strict_parsing)
 
         if not os.path.exists(self._output_file_path):
             os.makedirs(self._output_file_path)
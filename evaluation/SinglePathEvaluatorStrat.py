@@ -1,13 +1,12 @@
-import ast
 import configparser
 import csv
 import os
 
-import osmnx as ox
+import numpy
 from Strategy import Strategy
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 
-from evaluation import EvalUtil
+from evaluation import Metrics
+from util import PathParser
 
 
 class SinglePathEvaluatorStrat(Strategy):
@@ -17,6 +16,8 @@ class SinglePathEvaluatorStrat(Strategy):
         self._input_method_name = config[method]['input_method_name']
         self._input_file_name = config[method]['input_file_name']
         self._graphml_file_path = config['osm']['graphml_file_path']
+        self._ground_truth_cache_path = config['eval-gt']['cache_path']
+        self._strict_parsing = config['DEFAULT'].getboolean('strict_parsing')
 
         self._ground_truth_file = os.path.join(config['fmm']['output_path'], config['fmm']['train_file_name'])
         self._result_file = os.path.join(config[self._input_method_name]['output_path'],
@@ -26,20 +27,28 @@ class SinglePathEvaluatorStrat(Strategy):
         self._output_file_path = os.path.join(config[method]['output_path'], config['fmm']['train_file_name'])
 
     def do_algorithm(self) -> None:
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.get_digraph(G, weight='length')
-        G_nodes = list(G.nodes)
+        G = self.resources.digraph(self._graphml_file_path, weight='length')
+        G_nodes = numpy.array(list(G.nodes), dtype=numpy.int64)
 
-        path_vectors = {}
         accuracies = {}
         precisions = {}
         recalls = {}
         recall_at_ns = {}
 
-        (tripIds, gt_path_vectors, gt_path_edges, gt_path_lengths, tripsTimestamps, tripsErrors,
-         errorList) = EvalUtil.calculate_groud_truth(G, self._ground_truth_file)
+        gt = self.resources.ground_truth(G, self._ground_truth_file, self._graphml_file_path,
+                                         self._ground_truth_cache_path, self._strict_parsing)
+        tripIds = gt.trip_ids
         total_rows = len(tripIds)
 
+        # collect all results first and score them in a single batch
+        result_trip_ids = []
+        gt_nodes = []
+        gt_edges = []
+        gt_lengths = []
+        pred_nodes = []
+        pred_edges = []
+        pred_edge_lengths = []
+
         with open(self._result_file, newline='') as csvfile:
             spamreader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
             i = 0
@@ -47,38 +56,25 @@ class SinglePathEvaluatorStrat(Strategy):
                 tripId = int(row['TRIP_ID'])
                 print(i / total_rows * 100, '%; trip_id: ', tripId)
                 i += 1
-                pathNodes = ast.literal_eval(row['NODE_PATH'])
-                node_set = set()
-                for n in pathNodes:
-                    node_set.add(n)
-
-                # print(tripId, len(node_set), node_set)
-                path_vectors[tripId] = []
-
-                for node in G_nodes:
-                    if node in node_set:
-                        path_vectors[tripId].append(1)
-                    else:
-                        path_vectors[tripId].append(0)
-
-                precision = precision_score(gt_path_vectors[tripId], path_vectors[tripId])
-                recall = recall_score(gt_path_vectors[tripId], path_vectors[tripId])
-
-                pathLength = 0
-                intersectionLength = 0
-                for node_i in range(0, len(pathNodes) - 1):
-                    e = (pathNodes[node_i], pathNodes[node_i + 1])
-                    pathLength += G.edges[e[0], e[1]]['length']
-                    if e in gt_path_edges[tripId]:
-                        intersectionLength += G.edges[e[0], e[1]]['length']
-
-                recall_at_n = intersectionLength / gt_path_lengths[tripId]
-                accuracy = intersectionLength / max(gt_path_lengths[tripId], pathLength)
-
-                precisions[tripId] = precision
-                recalls[tripId] = recall
-                recall_at_ns[tripId] = recall_at_n
-                accuracies[tripId] = accuracy
+                pathNodes = PathParser.parse_int_list(row['NODE_PATH'], self._strict_parsing).tolist()
+                path_edges = list(zip(pathNodes[:-1], pathNodes[1:]))
+
+                result_trip_ids.append(tripId)
+                gt_nodes.append(list(gt.path_nodes(tripId)))
+                gt_edges.append(gt.path_edges[tripId])
+                gt_lengths.append(gt.path_lengths[tripId])
+                pred_nodes.append(pathNodes)
+                pred_edges.append(path_edges)
+                pred_edge_lengths.append([G.edges[u, v]['length'] for (u, v) in path_edges])
+
+        (batch_precisions, batch_recalls, batch_recall_at_ns,
+         batch_accuracies) = Metrics.score_batch(gt_nodes, pred_nodes, gt_edges, pred_edges, pred_edge_lengths,
+                                                 gt_lengths, universe=G_nodes)
+        for i, tripId in enumerate(result_trip_ids):
+            precisions[tripId] = float(batch_precisions[i])
+            recalls[tripId] = float(batch_recalls[i])
+            recall_at_ns[tripId] = float(batch_recall_at_ns[i])
+            accuracies[tripId] = float(batch_accuracies[i])
 
         if not os.path.exists(self._output_path):
             print("Creating output directory: ", self._output_path)
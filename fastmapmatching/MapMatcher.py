@@ -1,13 +1,17 @@
-import ast
 import configparser
 import csv
+import itertools
+import json
 import os
+import shutil
 
 import networkx as nx
+import numpy as np
 from Strategy import Strategy
 from fmm import FastMapMatch, Network, NetworkGraph, UBODT, FastMapMatchConfig
+from fastmapmatching import UbodtCache
 from shapely.geometry import LineString
-from util import Util
+from util import Parallel, PathParser, Util
 
 
 def _get_path_duration(G, path):
@@ -18,9 +22,56 @@ def _get_path_duration(G, path):
     return duration
 
 
-# get (u, v) tuple for edges based on fid
-def _get_nodes(G, edge_fid):
-    return next(filter(lambda edge: (G.get_edge_data(*edge)['fid'] in [edge_fid]), G.edges), None)
+def _build_fid_lookup(G) -> np.ndarray:
+    # dense fid -> (u, v) table, -1 marks fids that are not part of the graph. like the linear search over G.edges
+    # it replaces, the first edge with a fid wins
+    fids = nx.get_edge_attributes(G, 'fid')
+    fid_lookup = np.full((max(fids.values()) + 1, 2), -1, dtype=np.int64)
+    for (u, v), fid in fids.items():
+        if not (isinstance(u, (int, np.integer)) and isinstance(v, (int, np.integer)) and u >= 0 and v >= 0):
+            raise ValueError('Edge with fid ' + str(fid) + ' has node ids ' + repr((u, v)) +
+                             ', the fid lookup needs non-negative integers')
+        if fid_lookup[fid, 0] == -1:
+            fid_lookup[fid] = (u, v)
+    return fid_lookup
+
+
+# get (u, v) tuples for edges based on fid, None for unknown edges
+def _get_nodes(fid_lookup, edge_fids) -> list:
+    edge_fids = np.asarray(edge_fids, dtype=np.int64)
+    known = (edge_fids >= 0) & (edge_fids < len(fid_lookup))
+    edges = fid_lookup[np.where(known, edge_fids, 0)]
+    known &= edges[:, 0] >= 0
+    return [tuple(edge) if k else None for edge, k in zip(edges.tolist(), known.tolist())]
+
+
+def _read_chunks(reader, chunk_size: int):
+    while True:
+        rows = list(itertools.islice(reader, chunk_size))
+        if not rows:
+            return
+        yield rows
+
+
+def _chunk_file(chunks_path: str, chunk_index: int) -> str:
+    return os.path.join(chunks_path, 'chunk_{:06d}.csv'.format(chunk_index))
+
+
+def _prepare_chunks_dir(chunks_path: str, input_path: str, chunk_size: int) -> None:
+    # chunks of an earlier run can only be reused if they were cut from the same input with the same chunk size
+    stat = os.stat(input_path)
+    meta = {'input_size': stat.st_size, 'input_mtime_ns': stat.st_mtime_ns, 'chunk_size': chunk_size}
+    meta_path = os.path.join(chunks_path, 'chunks.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as meta_file:
+            if json.load(meta_file) == meta:
+                return
+    if os.path.exists(chunks_path):
+        print('Discarding chunks of a different input:', chunks_path)
+        shutil.rmtree(chunks_path)
+    os.makedirs(chunks_path)
+    with open(meta_path, 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file)
 
 
 class MapMatchingStrat(Strategy):
@@ -31,59 +82,40 @@ class MapMatchingStrat(Strategy):
 
         self._fmm_path = config['fmm']['output_path']
         self._fmm_file_name = config['DEFAULT']['train_file_name']
-        self._ubodt_path = os.path.join(self._fmm_path, "ubodt.txt")
+        self._ubodt_binary = config['fmm'].getboolean('ubodt_binary')
+        self._ubodt_path = UbodtCache.ubodt_file_path(self._fmm_path, self._ubodt_binary)
+        self._ubodt_delta = float(config['fmm']['ubodt_delta'])
         self._train_data_path = config['fmm']['train_data_path']
         self._trajectory_interval = int(config['fmm']['trajectory_interval'])
 
         self._k = int(config['fmm']['k'])
         self._radius = float(config['fmm']['radius'])
         self._gps_error = float(config['fmm']['gps_error'])
+        self._chunk_size = int(config['fmm']['chunk_size'])
+        self._workers = int(config['parallel']['workers'])
+        self._strict_parsing = config['DEFAULT'].getboolean('strict_parsing')
         self._path_edges = os.path.join(self._fmm_path, "edges.shp")
 
-    def _match_row(self, model, fmm_config, line):
-        ls = LineString(ast.literal_eval(line))
+    def _match_row(self, model, fmm_config, poly):
+        ls = LineString(poly)
         result = model.match_wkt(ls.wkt, fmm_config)
         return result
 
-    def _do_mapmatching(self, model, fmm_config, input_path, output_path):
-
-        # loading graph
-        path_edges = os.path.join(self._osm_path, "edges.shp")
-        path_nodes = os.path.join(self._osm_path, "nodes.shp")
-        G = Util.load_graph(path_edges, path_nodes, self._speed_limits_path)
-
-        output_path = os.path.join(output_path, self._fmm_file_name)
-        input_path = os.path.join(input_path, self._fmm_file_name)
-
-        with open(input_path, newline='', encoding='utf-8') as input_file:
-            lines = len(input_file.readlines())
-            print('lines: ', lines)
-
-        with open(input_path, newline='', encoding='utf-8') as input_file, open(output_path, 'w', newline='',
-                                                                                encoding='utf-8') as output_file:
-            r = csv.DictReader(input_file, delimiter=',')
-            fieldnames = r.fieldnames
-            fieldnames.append('START_NODE')
-            fieldnames.append('END_NODE')
-            fieldnames.append('CPATH')
-            fieldnames.append('OPATH')
-            fieldnames.append('REAL_DURATION')
-            fieldnames.append('MAPPED_DURATION')
+    def _match_chunk(self, model, fmm_config, G, fid_lookup, fieldnames, chunks_path, chunk) -> (int, int, int):
+        chunk_index, rows = chunk
+        chunk_path = _chunk_file(chunks_path, chunk_index)
+        matched = 0
+        with open(chunk_path + '.tmp', 'w', newline='', encoding='utf-8') as output_file:
             w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
-            w.writeheader()
-
-            i = 0
-            for row in r:
-                i += 1
-                if i % 1000 == 0:
-                    print(i / lines * 100, "%")
+            for row in rows:
                 try:
-                    row_result = self._match_row(model, fmm_config, row['POLYLINE'])
+                    poly = PathParser.parse_float_pairs(row['POLYLINE'], self._strict_parsing)
+                    row_result = self._match_row(model, fmm_config, poly)
 
                     cpath = list(row_result.cpath)
                     opath = list(row_result.opath)
-                    cpath = list(map(lambda fid: _get_nodes(G, fid), cpath))
-                    opath = list(map(lambda fid: _get_nodes(G, fid), opath))
+                    cpath = _get_nodes(fid_lookup, cpath)
+                    opath = _get_nodes(fid_lookup, opath)
 
                     if len(cpath) > 1 and None not in cpath:
                         first_edge = cpath[0]
@@ -95,7 +127,6 @@ class MapMatchingStrat(Strategy):
                         row['OPATH'] = opath
 
                         # determine real duration
-                        poly = ast.literal_eval(row['POLYLINE'])
                         trajectory_duration = (len(poly) - 1) * self._trajectory_interval
                         row['REAL_DURATION'] = trajectory_duration
 
@@ -104,14 +135,59 @@ class MapMatchingStrat(Strategy):
                         row['MAPPED_DURATION'] = mapped_duration
 
                         w.writerow(row)
+                        matched += 1
                     else:
                         print('Missing Edges')
                 except ValueError:
                     print('ValueError')
                 except RuntimeError:
                     print('RuntimeError')
+        # a chunk file only exists once it is complete, so an interrupted run can resume after it
+        os.replace(chunk_path + '.tmp', chunk_path)
+        return chunk_index, len(rows), matched
+
+    def _do_mapmatching(self, model, fmm_config, input_path, output_path):
+
+        # loading graph
+        path_edges = os.path.join(self._osm_path, "edges.shp")
+        path_nodes = os.path.join(self._osm_path, "nodes.shp")
+        G = Util.load_graph(path_edges, path_nodes, self._speed_limits_path)
+        fid_lookup = _build_fid_lookup(G)
+
+        output_path = os.path.join(output_path, self._fmm_file_name)
+        input_path = os.path.join(input_path, self._fmm_file_name)
+        chunks_path = output_path + '.chunks'
+        _prepare_chunks_dir(chunks_path, input_path, self._chunk_size)
+
+        with open(input_path, newline='', encoding='utf-8') as input_file:
+            r = csv.DictReader(input_file, delimiter=',')
+            fieldnames = r.fieldnames
+            fieldnames.append('START_NODE')
+            fieldnames.append('END_NODE')
+            fieldnames.append('CPATH')
+            fieldnames.append('OPATH')
+            fieldnames.append('REAL_DURATION')
+            fieldnames.append('MAPPED_DURATION')
+
+            # chunks of an interrupted run are skipped, the others are matched while the input is streamed
+            chunks = ((chunk_index, rows) for chunk_index, rows in enumerate(_read_chunks(r, self._chunk_size))
+                      if not os.path.exists(_chunk_file(chunks_path, chunk_index)))
+            for chunk_index, num_rows, matched in Parallel.imap_ordered(
+                    lambda chunk: self._match_chunk(model, fmm_config, G, fid_lookup, fieldnames, chunks_path, chunk),
+                    chunks, self._workers, max_pending=2 * self._workers):
+                print('chunk', chunk_index, 'matched', matched, 'of', num_rows, 'trajectories')
+
+        # join the chunks in input order
+        with open(output_path + '.tmp', 'w', newline='', encoding='utf-8') as output_file:
+            w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
+            w.writeheader()
+            for chunk_file_name in sorted(f for f in os.listdir(chunks_path) if f.endswith('.csv')):
+                with open(os.path.join(chunks_path, chunk_file_name), newline='', encoding='utf-8') as chunk_file:
+                    shutil.copyfileobj(chunk_file, output_file)
+        os.replace(output_path + '.tmp', output_path)
+        shutil.rmtree(chunks_path)
 
-            print('done')
+        print('done')
 
     def do_algorithm(self) -> None:
         path_edges = os.path.join(self._osm_path, "edges.shp")
@@ -126,7 +202,15 @@ class MapMatchingStrat(Strategy):
         print("Loading UBODT")
         if not os.path.exists(self._ubodt_path):
             raise FileNotFoundError(self._ubodt_path)
-        ubodt = UBODT.read_ubodt_csv(self._ubodt_path)
+        # a ubodt of another network or delta would silently give wrong matches
+        if not UbodtCache.is_current(self._ubodt_path, path_edges, self._ubodt_delta, self._ubodt_binary):
+            raise ValueError('UBODT ' + self._ubodt_path + ' was not generated from ' + path_edges + ' with delta ' +
+                             str(self._ubodt_delta) + '. Regenerate it with UbodtGeneratorStrat, e.g. python Main.py '
+                             '-fmm')
+        if self._ubodt_binary:
+            ubodt = UBODT.read_ubodt_binary(self._ubodt_path)
+        else:
+            ubodt = UBODT.read_ubodt_csv(self._ubodt_path)
 
         print("Creating model")
         model = FastMapMatch(network, graph, ubodt)
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import os
+
+# bump this whenever the meta data or the way the ubodt is generated changes
+_UBODT_VERSION = 1
+
+
+def ubodt_file_path(fmm_path: str, binary: bool) -> str:
+    return os.path.join(fmm_path, 'ubodt.bin' if binary else 'ubodt.txt')
+
+
+def _meta_path(ubodt_path: str) -> str:
+    return ubodt_path + '.json'
+
+
+def _network_checksum(path_edges: str) -> str:
+    # the geometry is in the .shp, the fid, u and v attributes in the .dbf
+    sha1 = hashlib.sha1()
+    for file_path in (path_edges, os.path.splitext(path_edges)[0] + '.dbf'):
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _meta(path_edges: str, delta: float, binary: bool, checksum: str = None) -> dict:
+    return {'version': _UBODT_VERSION,
+            'delta': delta,
+            'binary': binary,
+            'network_sha1': checksum if checksum is not None else _network_checksum(path_edges)}
+
+
+def is_current(ubodt_path: str, path_edges: str, delta: float, binary: bool) -> bool:
+    """
+    Check if the ubodt was generated from the network shapefile with the same delta and format.
+    """
+    if not os.path.exists(ubodt_path) or not os.path.exists(_meta_path(ubodt_path)):
+        return False
+    with open(_meta_path(ubodt_path), encoding='utf-8') as meta_file:
+        try:
+            meta = json.load(meta_file)
+        except ValueError:
+            return False
+    return meta == _meta(path_edges, delta, binary)
+
+
+def write_meta(ubodt_path: str, path_edges: str, delta: float, binary: bool) -> None:
+    tmp_path = _meta_path(ubodt_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as meta_file:
+        json.dump(_meta(path_edges, delta, binary), meta_file)
+    os.replace(tmp_path, _meta_path(ubodt_path))
@@ -9,6 +9,8 @@ from shapely.geometry import LineString
 from Strategy import Strategy
 import configparser
 
+from fastmapmatching import UbodtCache
+
 
 class UbodtGeneratorStrat(Strategy):
 
@@ -16,13 +18,19 @@ class UbodtGeneratorStrat(Strategy):
         self._osm_path = config['osm']['output_path']
         self._fmm_path = config['fmm']['output_path']
         self._path_edges = os.path.join(self._osm_path, "edges.shp")
-        self._ubodt_path = os.path.join(self._fmm_path, "ubodt.txt")
+        self._ubodt_delta = float(config['fmm']['ubodt_delta'])
+        self._ubodt_binary = config['fmm'].getboolean('ubodt_binary')
+        self._ubodt_path = UbodtCache.ubodt_file_path(self._fmm_path, self._ubodt_binary)
 
     def do_algorithm(self) -> None:
         if not os.path.exists(self._fmm_path):
             print("Creating output directory: ", self._fmm_path)
             os.makedirs(self._fmm_path)
 
+        if UbodtCache.is_current(self._ubodt_path, self._path_edges, self._ubodt_delta, self._ubodt_binary):
+            print("UBODT is up to date: ", self._ubodt_path)
+            return
+
         ### Read network data
         print("Opening network")
         network = Network(self._path_edges, "fid", "u", "v")
@@ -32,5 +40,7 @@ class UbodtGeneratorStrat(Strategy):
         ### Precompute an UBODT table
         print("Generating UBODT")
         ubodt_gen = UBODTGenAlgorithm(network, graph)
-        status = ubodt_gen.generate_ubodt(self._ubodt_path, 0.02, binary=False, use_omp=True)
+        status = ubodt_gen.generate_ubodt(self._ubodt_path, self._ubodt_delta, binary=self._ubodt_binary,
+                                          use_omp=True)
         print("Status: ", status)
+        UbodtCache.write_meta(self._ubodt_path, self._path_edges, self._ubodt_delta, self._ubodt_binary)
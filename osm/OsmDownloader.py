@@ -8,6 +8,7 @@ import numpy as np
 import osmnx as ox
 import pandas as pd
 from Strategy import Strategy
+from util import GraphSnapshot
 
 
 class OsmDownloaderStrat(Strategy):
@@ -81,3 +82,6 @@ class OsmDownloaderStrat(Strategy):
         G = ox.add_edge_speeds(G)
         G = ox.add_edge_travel_times(G)
         ox.save_graphml(G, self._graphml_file_path)
+
+        print("Saving graph snapshots")
+        GraphSnapshot.write_snapshots(G, self._graphml_file_path)
@@ -7,12 +7,13 @@ import pandas as pd
 import itertools
 
 import networkx as nx
-import osmnx as ox
 from scipy.optimize import lsq_linear
+from scipy.sparse import csr_matrix
 import numpy as np
 
 from Strategy import Strategy
-from util import HighwayExtractor
+from util import HighwayExtractor, Parallel, PathStore
+from util.CompactGraph import CompactGraph
 
 
 class BatchStrat(Strategy):
@@ -30,6 +31,20 @@ class BatchStrat(Strategy):
         self._output_dir_path = os.path.join(self._output_dir_path, self._train_file_name)
         self._output_path = os.path.join(self._output_dir_path, "batch_paths.csv")
         self._highway_path = os.path.join(self._output_dir_path, "highway_types.csv")
+        self._engine = config['graph']['engine']
+        self._lsq_solver = config['batch']['lsq_solver']
+        if self._lsq_solver not in ('auto', 'exact', 'lsmr'):
+            raise ValueError('Unknown lsq_solver: ' + self._lsq_solver)
+        self._dense_max_entries = int(config['batch']['dense_max_entries'])
+        self._workers = int(config['parallel']['workers'])
+        self._penalized_duration = None
+
+    def _solve(self, a_matrix: csr_matrix, b_matrix: list):
+        rows, columns = a_matrix.shape
+        if self._lsq_solver == 'lsmr' or (self._lsq_solver == 'auto' and rows * columns > self._dense_max_entries):
+            return lsq_linear(a_matrix, b_matrix, bounds=(1, 5), lsq_solver='lsmr')
+        # the dense solver gives the same results as before the system matrix was sparse
+        return lsq_linear(a_matrix.toarray(), b_matrix, bounds=(1, 5))
 
     def find_batch_paths(self, g, trips):
 
@@ -37,34 +52,102 @@ class BatchStrat(Strategy):
 
         result = {}
 
+        compact = isinstance(g, CompactGraph)
+
         if len(trips) == 1:
             (tripid, source, target, real_duration) = trips[0]
-            result[tripid] = nx.shortest_path(g, source, target, weight=self._weight)
+            if compact:
+                result[tripid] = [g.shortest_path(source, target, weight=self._weight)]
+            else:
+                result[tripid] = [nx.shortest_path(g, source, target, weight=self._weight)]
             return result
 
         resultEdges = {}
         penalizedEdges = set()
 
-        edges_duration = nx.get_edge_attributes(g, self._weight)
-        nx.set_edge_attributes(g, edges_duration, "penalized_duration")
+        if compact:
+            # penalties go into a copy of the weights private to this process, so the graph is never written and
+            # only the scaled edges have to be reset
+            if self._penalized_duration is None:
+                self._penalized_duration = list(g.weights(self._weight))
+            penalized_duration = self._penalized_duration
+            edge_positions = {}
+            scaled_edges = set()
+
+            def shortest_path(source, target):
+                s = g.index[source]
+                t = g.index[target]
+                dist, pred_edge = g.dijkstra(s, t, weights=penalized_duration)
+                if t not in dist:
+                    raise nx.NetworkXNoPath(f'No path to {target}.')
+                path = g.to_node_ids(g.path_to(pred_edge, t))
+                for u, v, e in zip(path[:-1], path[1:], g.edge_indices(path).tolist()):
+                    edge_positions[(u, v)] = e
+                return dist[t], path
+
+            def get_penalized_duration(u, v):
+                return penalized_duration[edge_positions[(u, v)]]
+
+            def scale_penalized_duration(u, v, factor):
+                penalized_duration[edge_positions[(u, v)]] *= factor
+                scaled_edges.add(edge_positions[(u, v)])
+
+            def reset_penalized_duration():
+                weights = g.weights(self._weight)
+                for e in scaled_edges:
+                    penalized_duration[e] = weights[e]
+        else:
+            edges_duration = nx.get_edge_attributes(g, self._weight)
+            nx.set_edge_attributes(g, edges_duration, "penalized_duration")
+
+            def shortest_path(source, target):
+                return nx.single_source_dijkstra(g, source, target, weight="penalized_duration")
+
+            def get_penalized_duration(u, v):
+                return g.edges[u, v]['penalized_duration']
+
+            def scale_penalized_duration(u, v, factor):
+                g.edges[u, v]['penalized_duration'] *= factor
+
+            def reset_penalized_duration():
+                edges_duration = nx.get_edge_attributes(g, self._weight)
+                nx.set_edge_attributes(g, edges_duration, "penalized_duration")
 
         accessedEdges = set()
         errors = {}
         maxError = 0
 
+        # rows of the system matrix that belong to a trip, and the trips that used an edge so far. the system
+        # matrix is built from this inverse index instead of testing every edge against every trip
+        trip_rows = {}
+        for row, (tripid, source, target, real_duration) in enumerate(trips):
+            trip_rows.setdefault(tripid, []).append(row)
+        edge_trips = {}
+
+        def add_result_edge(tripid, edge):
+            if edge not in resultEdges[tripid]:
+                resultEdges[tripid].add(edge)
+                edge_trips.setdefault(edge, []).append(tripid)
+
+        b_matrix = [real_duration for (tripid, source, target, real_duration) in trips]
+        iterations = 0
+        solver_time = 0
+        max_columns = 0
+        max_nnz = 0
+
         dist = -1
         spath = []
 
         # First path computation
         for (tripid, source, target, real_duration) in trips:
-            dist, spath = nx.single_source_dijkstra(g, source, target, weight="penalized_duration")
+            dist, spath = shortest_path(source, target)
             if tripid not in result:
                 result[tripid] = []
                 resultEdges[tripid] = set()
 
             for i in range(0, len(spath) - 1):
                 accessedEdges.add((spath[i], spath[i + 1]))
-                resultEdges[tripid].add((spath[i], spath[i + 1]))
+                add_result_edge(tripid, (spath[i], spath[i + 1]))
             result[tripid].append(spath)
             errors[tripid] = real_duration - dist
             if (errors[tripid] > maxError):
@@ -85,42 +168,46 @@ class BatchStrat(Strategy):
             # print("error = ",prevError)
 
             # Computing penalties
-            a_matrix = []
-            b_matrix = []
-            for (tripid, source, target, real_duration) in trips:
-                tempVector = []
-                # print(resultEdges[tripid])
-                for (u, v) in accessedEdgesList:
-                    if (u, v) in resultEdges[tripid]:
-                        tempVector.append(g.edges[u, v]['penalized_duration'])
-                    else:
-                        tempVector.append(0)
-                a_matrix.append(tempVector)
-                b_matrix.append(real_duration)
-
-            a_matrix_rows = len(a_matrix)
-            a_matrix_columns = len(a_matrix[0])
-
-            x = lsq_linear(a_matrix, b_matrix, bounds=(1, 5))
+            rows = []
+            columns = []
+            data = []
+            for j, (u, v) in enumerate(accessedEdgesList):
+                duration = get_penalized_duration(u, v)
+                for tripid in edge_trips[(u, v)]:
+                    for row in trip_rows[tripid]:
+                        rows.append(row)
+                        columns.append(j)
+                        data.append(duration)
+
+            a_matrix_rows = len(trips)
+            a_matrix_columns = len(accessedEdgesList)
+            a_matrix = csr_matrix((data, (rows, columns)), shape=(a_matrix_rows, a_matrix_columns))
+
+            start_time = time.time()
+            x = self._solve(a_matrix, b_matrix)
+            solver_time += time.time() - start_time
+            iterations += 1
+            max_columns = max(max_columns, a_matrix_columns)
+            max_nnz = max(max_nnz, a_matrix.nnz)
 
             # Applying penalties
             for i in range(0, a_matrix_columns):
-                prevWeight = g.edges[accessedEdgesList[i][0], accessedEdgesList[i][1]]['penalized_duration']
-                g.edges[accessedEdgesList[i][0], accessedEdgesList[i][1]]['penalized_duration'] *= x.x[i]
+                prevWeight = get_penalized_duration(accessedEdgesList[i][0], accessedEdgesList[i][1])
+                scale_penalized_duration(accessedEdgesList[i][0], accessedEdgesList[i][1], x.x[i])
 
             # Initiating next iteration
             errors = {}
             accessedEdges = set()
 
             for (tripid, source, target, real_duration) in trips:
-                dist, spath = nx.single_source_dijkstra(g, source, target, weight="penalized_duration")
+                dist, spath = shortest_path(source, target)
                 if tripid not in result:
                     result[tripid] = []
                     resultEdges[tripid] = set()
                 result[tripid].append(spath)
                 for i in range(0, len(spath) - 1):
                     accessedEdges.add((spath[i], spath[i + 1]))
-                    resultEdges[tripid].add((spath[i], spath[i + 1]))
+                    add_result_edge(tripid, (spath[i], spath[i + 1]))
 
                 errors[tripid] = abs(real_duration - dist)
             accessedEdgesList = list(accessedEdges)
@@ -137,11 +224,18 @@ class BatchStrat(Strategy):
         # print(resultsLengths)
         # print("error = ",prevError)
 
-        edges_duration = nx.get_edge_attributes(g, self._weight)
-        nx.set_edge_attributes(g, edges_duration, "penalized_duration")
+        reset_penalized_duration()
+
+        print('solver iterations:', iterations, 'solver time [s]:', solver_time, 'system matrix:', len(trips), 'x',
+              max_columns, 'nnz:', max_nnz)
 
         return result
 
+    def _find_window_paths(self, g, trips) -> (dict, float):
+        start_time = time.time()
+        result = self.find_batch_paths(g, trips)
+        return result, time.time() - start_time
+
     def do_algorithm(self) -> None:
         trajectory_path = os.path.join(self._fmm_path, self._train_file_name)
 
@@ -150,17 +244,18 @@ class BatchStrat(Strategy):
             os.makedirs(self._output_dir_path)
 
         print("loading graph")
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.utils_graph.get_digraph(G, weight=self._weight)
-        print('G nodes', len(G.nodes()))
-        print('G edges', len(G.edges()))
+        if self._engine == 'compact':
+            G = self.resources.compact_graph(self._graphml_file_path, weight=self._weight)
+        else:
+            G = self.resources.digraph(self._graphml_file_path, weight=self._weight)
+        print('G nodes', G.number_of_nodes())
+        print('G edges', G.number_of_edges())
 
         print("loading trajectories")
-        with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file:
+        with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file, \
+                PathStore.PathStoreWriter(self._output_dir_path) as path_store:
             trajectory_csv = csv.DictReader(trajectory_file, delimiter=',')
 
-            fieldnames = ['TRIP_ID', 'PATH_ID', 'START_NODE', 'END_NODE', 'NODE_PATH', 'RUNTIME']
-
             trips = []
             tripTimestamps = {}
             tripTimestampsList = []
@@ -192,23 +287,30 @@ class BatchStrat(Strategy):
             for row in tripSeries.items():
                 tripBatches.append(row[1])
 
+            trip_rows_by_id = {}
+            for row_index, trip in enumerate(trips):
+                trip_rows_by_id.setdefault(trip[0], []).append(row_index)
+
             print("trajectories split into ",len(tripBatches),"batches.")
+            # every trip with an id in the batch, in the order of the trips file. a repeated id brings all its
+            # trips into the batch, like filtering the trips by the batch ids did
+            batchQueries = []
             for batch in tripBatches:
-
-                batchQuery = [x for x in trips if x[0] in batch]
-                recoveredTrips = self.find_batch_paths(G, batchQuery)
+                if batch:
+                    row_indices = sorted(row_index for tripid in dict.fromkeys(batch)
+                                         for row_index in trip_rows_by_id[tripid])
+                    batchQueries.append([trips[row_index] for row_index in row_indices])
+
+            # windows only share the graph, so they can be solved in any process. results come back in window
+            # order, which keeps the output identical to a serial run
+            results = Parallel.imap_ordered(lambda batchQuery: self._find_window_paths(G, batchQuery), batchQueries,
+                                            self._workers)
+            for i, (recoveredTrips, execution_time) in enumerate(results):
+                print('window', i + 1, 'of', len(batchQueries), ';', len(recoveredTrips), 'trips;', execution_time,
+                      's')
 
                 for k, v in recoveredTrips.items():
                     v_prime = v
                     v_prime.sort()
                     v_prime = list(k for k, _ in itertools.groupby(v_prime))
-                    trip_output_file_name = os.path.join(self._output_dir_path, str(k) + '.csv')
-                    with open(trip_output_file_name, 'w', newline='', encoding='utf-8') as output_file:
-                        w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
-                        w.writeheader()
-                        path_id = 0
-                        for node_path in v_prime:
-                            new_row = {'TRIP_ID': k, 'PATH_ID': path_id, 'START_NODE': node_path[0],
-                                       'END_NODE': node_path[-1], 'NODE_PATH': node_path}
-                            w.writerow(new_row)
-                            path_id += 1
+                    path_store.add_trip(k, v_prime)
@@ -4,8 +4,9 @@ import os
 import time
 
 import networkx as nx
-import osmnx as ox
 from Strategy import Strategy
+from util import Parallel, PathStore
+from util.CompactGraph import CompactGraph
 
 
 class PenaltyStrat(Strategy):
@@ -22,42 +23,127 @@ class PenaltyStrat(Strategy):
             self._weight = 'travel_time'
         else:
             self._weight = 'length'
+        self._engine = config['graph']['engine']
+        self._workers = int(config['parallel']['workers'])
+        self._search = config['pen']['search']
+        self._penalized_duration = None
 
     def find_multiple_paths_distr(self, g, source, target, trajectory_duration):
+        # penalized_duration equals travel_time on all edges between trips, see do_algorithm
         result = []
         penalized_edges = set()
-        edges_duration = nx.get_edge_attributes(g, "travel_time")
-        nx.set_edge_attributes(g, edges_duration, "penalized_duration")
         dist, spath = nx.single_source_dijkstra(g, source, target, weight="penalized_duration")
         result.append(spath)
         error = trajectory_duration - dist
 
         prevError = -1
-        while abs(error) > 1 and error != prevError:
-            validDist = dist
-            nonPenalizedDist = 0
-            for i in range(0, len(spath) - 1):
-                if (spath[i], spath[i + 1]) in penalized_edges:
-                    validDist -= g.edges[spath[i], spath[i + 1]]['penalized_duration']
-                    nonPenalizedDist += g.edges[spath[i], spath[i + 1]]['penalized_duration']
-
-            for i in range(0, len(spath) - 1):
-                if (spath[i], spath[i + 1]) not in penalized_edges:
-                    penalty = (g.edges[spath[i], spath[i + 1]]['penalized_duration'] / validDist) * error
-                    g.edges[spath[i], spath[i + 1]]['penalized_duration'] += penalty
-                    penalized_edges.add((spath[i], spath[i + 1]))
-
-            dist, spath = nx.single_source_dijkstra(g, source, target, weight="penalized_duration")
-            result.append(spath)
-            prevError = error
-            error = trajectory_duration - dist
-
-        edges_duration = nx.get_edge_attributes(g, "travel_time")
-        nx.set_edge_attributes(g, edges_duration, "penalized_duration")
+        iterations = 0
+        try:
+            while abs(error) > 1 and error != prevError:
+                validDist = dist
+                nonPenalizedDist = 0
+                for i in range(0, len(spath) - 1):
+                    if (spath[i], spath[i + 1]) in penalized_edges:
+                        validDist -= g.edges[spath[i], spath[i + 1]]['penalized_duration']
+                        nonPenalizedDist += g.edges[spath[i], spath[i + 1]]['penalized_duration']
+
+                for i in range(0, len(spath) - 1):
+                    if (spath[i], spath[i + 1]) not in penalized_edges:
+                        penalty = (g.edges[spath[i], spath[i + 1]]['penalized_duration'] / validDist) * error
+                        g.edges[spath[i], spath[i + 1]]['penalized_duration'] += penalty
+                        penalized_edges.add((spath[i], spath[i + 1]))
+
+                dist, spath = nx.single_source_dijkstra(g, source, target, weight="penalized_duration")
+                result.append(spath)
+                prevError = error
+                error = trajectory_duration - dist
+                iterations += 1
+        finally:
+            # only the penalized edges have to be reset
+            for (u, v) in penalized_edges:
+                g.edges[u, v]['penalized_duration'] = g.edges[u, v]['travel_time']
 
         result.append(spath)
 
-        return result
+        return result, iterations
+
+    def _penalty_overlay(self, cg: CompactGraph) -> list:
+        # durations shared by all trips of this process. every trip resets the edges it penalized
+        if self._penalized_duration is None:
+            self._penalized_duration = list(cg.weights('travel_time'))
+        return self._penalized_duration
+
+    def find_multiple_paths_distr_compact(self, cg: CompactGraph, source, target, trajectory_duration):
+        result = []
+        penalized_edges = set()
+        travel_time = cg.weights('travel_time')
+        penalized_duration = self._penalty_overlay(cg)
+        s = cg.index[source]
+        t = cg.index[target]
+        # lower bounds of the remaining duration to the target, valid as long as no penalty is negative
+        lower_bounds = None
+        lower_bounds_valid = self._search == 'astar'
+
+        def shortest_path():
+            if lower_bounds is not None and lower_bounds_valid:
+                dist, pred_edge = cg.astar(s, t, lower_bounds[0], lower_bounds[1], weights=penalized_duration)
+            else:
+                dist, pred_edge = cg.dijkstra(s, t, weights=penalized_duration)
+            if t not in dist:
+                raise nx.NetworkXNoPath(f'No path to {target}.')
+            path = cg.path_to(pred_edge, t)
+            return dist[t], cg.to_node_ids(path), [pred_edge[n] for n in path[1:]]
+
+        dist, spath, sedges = shortest_path()
+        result.append(spath)
+        error = trajectory_duration - dist
+
+        prevError = -1
+        iterations = 0
+        try:
+            while abs(error) > 1 and error != prevError:
+                if lower_bounds_valid and lower_bounds is None:
+                    # nodes further than the cutoff from the target are at least cutoff away
+                    cutoff = max(dist, trajectory_duration)
+                    lower_bounds = (cg.dijkstra(t, weights=travel_time, cutoff=cutoff, reverse=True)[0], cutoff)
+
+                validDist = dist
+                nonPenalizedDist = 0
+                for e in sedges:
+                    if e in penalized_edges:
+                        validDist -= penalized_duration[e]
+                        nonPenalizedDist += penalized_duration[e]
+
+                for e in sedges:
+                    if e not in penalized_edges:
+                        penalty = (penalized_duration[e] / validDist) * error
+                        penalized_duration[e] += penalty
+                        penalized_edges.add(e)
+                        if penalty < 0:
+                            lower_bounds_valid = False
+
+                dist, spath, sedges = shortest_path()
+                result.append(spath)
+                prevError = error
+                error = trajectory_duration - dist
+                iterations += 1
+        finally:
+            for e in penalized_edges:
+                penalized_duration[e] = travel_time[e]
+
+        result.append(spath)
+
+        return result, iterations
+
+    def _find_trip_paths(self, G, cg, trip) -> tuple:
+        (trip_id, start_node, end_node, trajectory_duration) = trip
+        start_time = time.time()
+        if cg is not None:
+            paths, iterations = self.find_multiple_paths_distr_compact(cg, start_node, end_node, trajectory_duration)
+        else:
+            paths, iterations = self.find_multiple_paths_distr(G, start_node, end_node, trajectory_duration)
+        execution_time = (time.time() - start_time)
+        return trip_id, start_node, end_node, paths, execution_time, iterations
 
     def do_algorithm(self) -> None:
         trajectory_path = os.path.join(self._fmm_path, self._fmm_train_name)
@@ -67,39 +153,41 @@ class PenaltyStrat(Strategy):
             os.makedirs(self._output_dir_path)
 
         print("loading graph")
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.get_digraph(G, weight=self._weight)
-        print('G nodes', len(G.nodes()))
-        print('G edges', len(G.edges()))
+        # only the graph the engine searches is built, the networkx digraph is slow to create from the snapshot
+        if self._engine == 'compact':
+            cg = self.resources.compact_graph(self._graphml_file_path, weight=self._weight)
+            G = None
+        else:
+            cg = None
+            G = self.resources.digraph(self._graphml_file_path, weight=self._weight)
+        graph = cg if G is None else G
+        print('G nodes', graph.number_of_nodes())
+        print('G edges', graph.number_of_edges())
+        if G is not None:
+            nx.set_edge_attributes(G, nx.get_edge_attributes(G, "travel_time"), "penalized_duration")
 
         print("loading trajectories")
         total_rows = sum(1 for _ in open(trajectory_path)) - 1
-        with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file:
+        with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file, \
+                PathStore.PathStoreWriter(self._output_dir_path, end_nodes=True) as path_store:
             trajectory_csv = csv.DictReader(trajectory_file, delimiter=',')
 
-            fieldnames = ['TRIP_ID', 'PATH_ID', 'START_NODE', 'END_NODE', 'NODE_PATH', 'RUNTIME']
+            trips = ((int(row['TRIP_ID']), int(row['START_NODE']), int(row['END_NODE']), float(row['REAL_DURATION']))
+                     for row in trajectory_csv)
+            results = Parallel.imap_ordered(lambda trip: self._find_trip_paths(G, cg, trip), trips, self._workers)
 
             i = 0
-            for row in trajectory_csv:
-                trip_id = int(row['TRIP_ID'])
-                print(i / total_rows * 100, '%; trip_id: ', trip_id)
+            total_iterations = 0
+            total_time = 0
+            for (trip_id, start_node, end_node, paths, execution_time, iterations) in results:
+                print(i / total_rows * 100, '%; trip_id: ', trip_id, '; iterations: ', iterations,
+                      '; iterations/s: ', iterations / execution_time if execution_time > 0 else 0)
                 i += 1
-                start_node = int(row['START_NODE'])
-                end_node = int(row['END_NODE'])
-                trajectory_duration = float(row['REAL_DURATION'])
-
-                start_time = time.time()
-                paths = self.find_multiple_paths_distr(G, start_node, end_node, trajectory_duration)
-                execution_time = (time.time() - start_time)
+                total_iterations += iterations
+                total_time += execution_time
 
                 # saving paths
-                trip_output_file_name = os.path.join(self._output_dir_path, str(trip_id) + '.csv')
-                with open(trip_output_file_name, 'w', newline='', encoding='utf-8') as output_file:
-                    w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
-                    w.writeheader()
-                    path_id = 0
-                    for node_path in paths:
-                        new_row = {'TRIP_ID': trip_id, 'PATH_ID': path_id, 'START_NODE': start_node,
-                                   'END_NODE': end_node, 'NODE_PATH': node_path, 'RUNTIME': execution_time}
-                        w.writerow(new_row)
-                        path_id += 1
+                path_store.add_trip(trip_id, paths, execution_time, start_node=start_node, end_node=end_node)
+
+        if total_time > 0:
+            print('penalty iterations:', total_iterations, 'iterations/s:', total_iterations / total_time)
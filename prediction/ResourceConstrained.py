@@ -4,44 +4,44 @@ import os
 import time
 
 import networkx as nx
-import osmnx as ox
 from Strategy import Strategy
-from util import HighwayExtractor
+from util import Parallel, PathStore
+from util.CompactGraph import CompactGraph
 
 
 class ResourceConstrainedStrat(Strategy):
+    """
+    k-shortest paths whose travel time lies within the duration bounds of the trajectory. Writes to the output
+    path of config section method, e.g. 'rc' or 'kspd'.
+    """
 
-    def __init__(self, config: configparser.ConfigParser) -> None:
+    def __init__(self, config: configparser.ConfigParser, method: str = 'rc') -> None:
         self._graphml_file_path = config['osm']['graphml_file_path']
         self._fmm_path = config['fmm']['output_path']
         self._train_file_name = config['DEFAULT']['train_file_name']
-        self._output_dir_path = config['rc']['output_path']
+        self._output_dir_path = config[method]['output_path']
         self._output_dir_path = os.path.join(self._output_dir_path, self._train_file_name)
-        self._output_path = os.path.join(self._output_dir_path, "resource_constrained.csv")
-        self._highway_path = os.path.join(self._output_dir_path, "highway_types.csv")
 
         self._weight = 'travel_time'
         self._duration_lower_bound = float(config['rc']['duration_lower_bound'])
         self._duration_upper_bound = float(config['rc']['duration_upper_bound'])
+        self._max_paths = int(config['rc']['max_paths'])
+        self._engine = config['graph']['engine']
+        self._workers = int(config['parallel']['workers'])
 
     def _find_paths(self, G, source, target, duration_lower_bound, duration_upper_bound):
-        sp_iterator = nx.shortest_simple_paths(G, source, target, weight=self._weight)
-        i = 0
         result = []
-
-        while True:
-            sp = next(sp_iterator)
-            i += 1
+        for i, sp in enumerate(nx.shortest_simple_paths(G, source, target, weight=self._weight), 1):
             # duration in seconds
             duration = nx.path_weight(G, sp, self._weight)
 
-            if len(result) > 1000:
-                break
             if duration > duration_upper_bound:
                 break
 
             if duration > duration_lower_bound:
                 result.append(sp)
+                if len(result) >= self._max_paths:
+                    break
 
             if i % 1000 == 0:
                 print("i:", i, " found paths: ", len(result), ' duration:', duration, ' upper bound:',
@@ -49,9 +49,53 @@ class ResourceConstrainedStrat(Strategy):
 
         return result
 
-        # node_path = nx.shortest_path(G, source=source, target=target, weight=self._weight)
-        # new_row = {'TRIP_ID': trip_id, 'START_NODE': start_node, 'END_NODE': end_node, 'NODE_PATH': node_path}
-        # w.writerow(new_row)
+    def _find_paths_compact(self, cg: CompactGraph, source, target, duration_lower_bound, duration_upper_bound):
+        sp_iterator = cg.k_shortest_paths(cg.index[source], cg.index[target], weight=self._weight,
+                                          max_cost=duration_upper_bound)
+        result = []
+        for duration, sp in sp_iterator:
+            if duration > duration_upper_bound:
+                break
+            if duration > duration_lower_bound:
+                result.append(cg.to_node_ids(sp))
+                if len(result) >= self._max_paths:
+                    break
+        return result
+
+    def _read_trips(self, trajectory_csv: csv.DictReader):
+        """
+        Yields the trips with their duration bounds. Skipped trips are yielded with bounds None, so they are still
+        written to the path store without paths.
+        """
+        for row in trajectory_csv:
+            trip_id = int(row['TRIP_ID'])
+            start_node = int(row['START_NODE'])
+            end_node = int(row['END_NODE'])
+            trajectory_duration = float(row['REAL_DURATION'])
+            mapped_duration = float(row['MAPPED_DURATION'])
+
+            # skip trajectories with very large difference between mapped and real trajectory
+            if trajectory_duration / mapped_duration > 1.5:
+                print('Skipping trajectory. Difference between mapped and real duration too big.',
+                      trajectory_duration / mapped_duration)
+                yield trip_id, start_node, end_node, None, None
+                continue
+
+            duration_lower_bound = trajectory_duration - (trajectory_duration * self._duration_lower_bound)
+            duration_upper_bound = trajectory_duration + (trajectory_duration * self._duration_upper_bound)
+            yield trip_id, start_node, end_node, duration_lower_bound, duration_upper_bound
+
+    def _find_trip_paths(self, G, cg: CompactGraph, trip) -> tuple:
+        (trip_id, start_node, end_node, duration_lower_bound, duration_upper_bound) = trip
+        if duration_upper_bound is None:
+            return trip_id, start_node, end_node, [], None
+        start_time = time.time()
+        if cg is not None:
+            paths = self._find_paths_compact(cg, start_node, end_node, duration_lower_bound, duration_upper_bound)
+        else:
+            paths = self._find_paths(G, start_node, end_node, duration_lower_bound, duration_upper_bound)
+        execution_time = (time.time() - start_time)
+        return trip_id, start_node, end_node, paths, execution_time
 
     def do_algorithm(self) -> None:
 
@@ -62,52 +106,38 @@ class ResourceConstrainedStrat(Strategy):
             os.makedirs(self._output_dir_path)
 
         print("loading graph")
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.utils_graph.get_digraph(G, weight=self._weight)
-        print('G nodes', len(G.nodes()))
-        print('G edges', len(G.edges()))
+        # only the graph the engine searches is built, the networkx digraph is slow to create from the snapshot
+        if self._engine == 'compact':
+            cg = self.resources.compact_graph(self._graphml_file_path, weight=self._weight)
+            G = None
+        else:
+            cg = None
+            G = self.resources.digraph(self._graphml_file_path, weight=self._weight)
+        graph = cg if G is None else G
+        print('G nodes', graph.number_of_nodes())
+        print('G edges', graph.number_of_edges())
 
         print("loading trajectories")
+        total_rows = sum(1 for _ in open(trajectory_path)) - 1
         with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file, \
-                open(self._output_path, 'w', newline='', encoding='utf-8') as output_file:
+                PathStore.PathStoreWriter(self._output_dir_path, end_nodes=True) as path_store:
             trajectory_csv = csv.DictReader(trajectory_file, delimiter=',')
 
-            fieldnames = ['TRIP_ID', 'PATH_ID', 'START_NODE', 'END_NODE', 'NODE_PATH', 'RUNTIME']
-            w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
-            w.writeheader()
-
-            for row in trajectory_csv:
-                trip_id = int(row['TRIP_ID'])
-                start_node = int(row['START_NODE'])
-                end_node = int(row['END_NODE'])
-                trajectory_duration = float(row['REAL_DURATION'])
-                mapped_duration = float(row['MAPPED_DURATION'])
-
-                # skip trajectories with very large difference between mapped and real trajectory
-                if trajectory_duration / mapped_duration > 1.5:
-                    print('Skipping trajectory. Difference between mapped and real duration too big.',
-                          trajectory_duration / mapped_duration)
-                    continue
-
-                print('trajectory_duration', trajectory_duration)
-                duration_lower_bound = trajectory_duration - (trajectory_duration * self._duration_lower_bound)
-                duration_upper_bound = trajectory_duration + (trajectory_duration * self._duration_upper_bound)
-                print('duration_lower_bound', duration_lower_bound)
-                print('duration_upper_bound', duration_upper_bound)
-
-                print('find_paths:', start_node, end_node, duration_lower_bound, duration_upper_bound)
-                start_time = time.time()
-                paths = self._find_paths(G, start_node, end_node, duration_lower_bound, duration_upper_bound)
-                execution_time = (time.time() - start_time)
+            trips = self._read_trips(trajectory_csv)
+            results = Parallel.imap_ordered(lambda trip: self._find_trip_paths(G, cg, trip), trips, self._workers)
+
+            i = 0
+            execution_times = []
+            for (trip_id, start_node, end_node, paths, execution_time) in results:
+                print(i / total_rows * 100, '%; trip_id: ', trip_id, '; paths: ', len(paths), '; runtime [s]: ',
+                      execution_time)
+                if execution_time is not None:
+                    execution_times.append(execution_time)
+                i += 1
 
                 # saving paths
-                print('writing paths to disk.')
-                path_id = 0
-                for node_path in paths:
-                    new_row = {'TRIP_ID': trip_id, 'PATH_ID': path_id, 'START_NODE': start_node, 'END_NODE': end_node,
-                               'NODE_PATH': node_path, 'RUNTIME': execution_time}
-                    w.writerow(new_row)
-                    path_id += 1
-                break
+                path_store.add_trip(trip_id, paths, execution_time, start_node=start_node, end_node=end_node)
 
-        HighwayExtractor.extract_highway_types_G(G, self._output_path, self._highway_path)
+        if execution_times:
+            print('trips:', len(execution_times), 'mean runtime [s]:', sum(execution_times) / len(execution_times),
+                  'max runtime [s]:', max(execution_times))
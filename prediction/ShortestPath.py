@@ -4,9 +4,9 @@ import os
 import time
 
 import networkx as nx
-import osmnx as ox
 from Strategy import Strategy
 from util import HighwayExtractor
+from util import Parallel
 
 
 class ShortestPathStrat(Strategy):
@@ -27,6 +27,19 @@ class ShortestPathStrat(Strategy):
             self._output_dir_path = os.path.join(self._output_dir_path, self._train_file_name)
             self._output_path = os.path.join(self._output_dir_path, "shortest_paths.csv")
         self._highway_path = os.path.join(self._output_dir_path, "highway_types.csv")
+        self._engine = config['graph']['engine']
+        self._workers = int(config['parallel']['workers'])
+        self._strict_parsing = config['DEFAULT'].getboolean('strict_parsing')
+
+    def _find_path(self, G, cg, trip) -> tuple:
+        (trip_id, start_node, end_node) = trip
+        start_time = time.time()
+        if cg is not None:
+            node_path = cg.shortest_path(start_node, end_node, weight=self._weight)
+        else:
+            node_path = nx.shortest_path(G, source=start_node, target=end_node, weight=self._weight)
+        execution_time = (time.time() - start_time)
+        return trip_id, start_node, end_node, node_path, execution_time
 
     def do_algorithm(self) -> None:
         trajectory_path = os.path.join(self._fmm_path, self._train_file_name)
@@ -36,10 +49,16 @@ class ShortestPathStrat(Strategy):
             os.makedirs(self._output_dir_path)
 
         print("loading graph")
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.utils_graph.get_digraph(G, weight=self._weight)
-        print('G nodes', len(G.nodes()))
-        print('G edges', len(G.edges()))
+        # only the graph the engine searches is built, the networkx digraph is slow to create from the snapshot
+        if self._engine == 'compact':
+            cg = self.resources.compact_graph(self._graphml_file_path, weight=self._weight)
+            G = None
+        else:
+            cg = None
+            G = self.resources.digraph(self._graphml_file_path, weight=self._weight)
+        graph = cg if G is None else G
+        print('G nodes', graph.number_of_nodes())
+        print('G edges', graph.number_of_edges())
 
         print("loading trajectories")
         with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file, \
@@ -50,15 +69,15 @@ class ShortestPathStrat(Strategy):
             w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
             w.writeheader()
 
-            for row in trajectory_csv:
-                trip_id = int(row['TRIP_ID'])
-                start_node = int(row['START_NODE'])
-                end_node = int(row['END_NODE'])
-                start_time = time.time()
-                node_path = nx.shortest_path(G, source=start_node, target=end_node, weight=self._weight)
-                execution_time = (time.time() - start_time)
+            trips = ((int(row['TRIP_ID']), int(row['START_NODE']), int(row['END_NODE'])) for row in trajectory_csv)
+            results = Parallel.imap_ordered(lambda trip: self._find_path(G, cg, trip), trips, self._workers)
+
+            for (trip_id, start_node, end_node, node_path, execution_time) in results:
                 new_row = {'TRIP_ID': trip_id, 'START_NODE': start_node, 'END_NODE': end_node, 'NODE_PATH': node_path,
                            'RUNTIME': execution_time}
                 w.writerow(new_row)
 
-        HighwayExtractor.extract_highway_types_G(G, self._output_path, self._highway_path)
+        # cg is None with the networkx engine, the highway ranks come from the compact graph either way
+        highway_cg = self.resources.compact_graph(self._graphml_file_path, weight=self._weight)
+        HighwayExtractor.extract_highway_types_G(highway_cg, self._output_path, self._highway_path,
+                                                 self._strict_parsing)
@@ -2,11 +2,56 @@ import configparser
 import csv
 import itertools
 import os
+import sys
 import time
+import tracemalloc
 
 import networkx as nx
-import osmnx as ox
 from Strategy import Strategy
+from util import Parallel, PathStore
+from util.CompactGraph import CompactGraph
+
+# relative slack for pruning by d_f + d_r, which sums the edge weights in a different order than the path check
+_PRUNE_TOLERANCE = 1e-9
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+def _max_rss():
+    # peak resident set size of this process in bytes. linux reports kilobytes, macos bytes
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _via_path_keys(cg: CompactGraph, forward_pred: dict, reverse_pred: dict, via_nodes) -> dict:
+    # the via path through v equals the one through w if w is v's successor in the reverse tree and the forward
+    # tree reaches w through v. following these steps as far as possible ends in the same node for all via nodes
+    # that share a path, so that node identifies the path without building it
+    sources, targets = cg.edge_endpoints()
+    keys = {}
+    for v in via_nodes:
+        chain = []
+        node = v
+        while node not in keys:
+            chain.append(node)
+            e = reverse_pred.get(node)
+            if e is None:
+                break
+            w = targets[e]
+            f = forward_pred.get(w)
+            if f is None or sources[f] != node:
+                break
+            node = w
+        key = keys.get(node, node)
+        for n in chain:
+            keys[n] = key
+    return keys
 
 
 class ViaPathsStrat(Strategy):
@@ -25,14 +70,16 @@ class ViaPathsStrat(Strategy):
             self._weight = 'length'
 
         self._duration_upper_bound = float(config['vp']['duration_upper_bound'])
+        self._engine = config['graph']['engine']
+        self._workers = int(config['parallel']['workers'])
+        self._trace_memory = config['vp'].getboolean('trace_memory')
 
-    def _find_paths(self, G, source, target, duration_upper_bound):
+    def _find_paths(self, G, G_reverse, source, target, duration_upper_bound):
         result = []
 
         forward_paths = nx.single_source_dijkstra_path(G, source, cutoff=duration_upper_bound, weight=self._weight)
         forward_set = set(forward_paths)
 
-        G_reverse = G.reverse()
         reverse_paths = nx.single_source_dijkstra_path(G_reverse, target, cutoff=duration_upper_bound,
                                                        weight=self._weight)
         reverse_set = set(reverse_paths)
@@ -57,6 +104,67 @@ class ViaPathsStrat(Strategy):
 
         return result
 
+    def _find_paths_compact(self, cg: CompactGraph, source, target, duration_upper_bound):
+        result = []
+
+        s = cg.index[source]
+        t = cg.index[target]
+        forward_dist, forward_pred = cg.dijkstra(s, weight=self._weight, cutoff=duration_upper_bound)
+        # searching the incoming edges replaces the copy made by G.reverse()
+        reverse_dist, reverse_pred = cg.dijkstra(t, weight=self._weight, cutoff=duration_upper_bound, reverse=True)
+
+        if self._weight == 'travel_time':
+            # the via path through n is at least d_f + d_r long, so most via nodes are dropped before building a path
+            limit = duration_upper_bound + _PRUNE_TOLERANCE * abs(duration_upper_bound)
+            via_nodes = [n for n, d in forward_dist.items() if n in reverse_dist and d + reverse_dist[n] <= limit]
+        else:
+            via_nodes = set.intersection(set(forward_dist), set(reverse_dist))
+
+        # group via nodes by path without building the paths
+        keys = _via_path_keys(cg, forward_pred, reverse_pred, via_nodes)
+        groups = {}
+        for n in via_nodes:
+            groups.setdefault(keys[n], []).append(n)
+
+        travel_time = cg.weights('travel_time')
+        for key, group in groups.items():
+            edges = cg.edges_to(forward_pred, key) + cg.edges_to(reverse_pred, key, reverse=True)
+            # check path length, summed along the path like nx.path_weight
+            duration = 0
+            for e in edges:
+                duration += travel_time[e]
+            if duration <= duration_upper_bound:
+                path = cg.to_node_ids(cg.edge_path_nodes(s, edges))
+                result.append((path, sorted(cg.to_node_ids(group))))
+
+        # paths are unique, so this gives the order of sorting and grouping (path, via node) pairs
+        result.sort()
+
+        return result
+
+    def _find_trip_paths(self, G, G_reverse, cg, trip) -> tuple:
+        (trip_id, start_node, end_node, trajectory_duration) = trip
+        duration_upper_bound = trajectory_duration + (trajectory_duration * self._duration_upper_bound)
+
+        if self._trace_memory:
+            # started lazily, so every worker process traces its own allocations
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            base_memory = tracemalloc.get_traced_memory()[0]
+
+        start_time = time.time()
+        if cg is not None:
+            paths = self._find_paths_compact(cg, start_node, end_node, duration_upper_bound)
+        else:
+            paths = self._find_paths(G, G_reverse, start_node, end_node, duration_upper_bound)
+        execution_time = (time.time() - start_time)
+
+        peak_memory = None
+        if self._trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1] - base_memory
+        return trip_id, start_node, end_node, paths, execution_time, _max_rss(), peak_memory
+
     def do_algorithm(self) -> None:
         trajectory_path = os.path.join(self._fmm_path, self._fmm_train_name)
 
@@ -65,43 +173,57 @@ class ViaPathsStrat(Strategy):
             os.makedirs(self._output_dir_path)
 
         print("loading graph")
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.utils_graph.get_digraph(G, weight=self._weight)
-        print('G nodes', len(G.nodes()))
-        print('G edges', len(G.edges()))
+        # only the graph the engine searches is built, the networkx digraph is slow to create from the snapshot
+        if self._engine == 'compact':
+            cg = self.resources.compact_graph(self._graphml_file_path, weight=self._weight)
+            G = None
+        else:
+            cg = None
+            G = self.resources.digraph(self._graphml_file_path, weight=self._weight)
+        graph = cg if G is None else G
+        print('G nodes', graph.number_of_nodes())
+        print('G edges', graph.number_of_edges())
+        G_reverse = None
+        if G is not None:
+            # reversed once instead of for every trip
+            G_reverse = G.reverse()
 
         print("loading trajectories")
         total_rows = sum(1 for _ in open(trajectory_path)) - 1
-        with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file:
+        with open(trajectory_path, newline='', encoding='utf-8') as trajectory_file, \
+                PathStore.PathStoreWriter(self._output_dir_path, via_nodes=True, end_nodes=True) as path_store:
             trajectory_csv = csv.DictReader(trajectory_file, delimiter=',')
 
-            fieldnames = ['TRIP_ID', 'PATH_ID', 'START_NODE', 'END_NODE', 'NODE_PATH', 'VIA_NODES', 'RUNTIME']
+            trips = ((int(row['TRIP_ID']), int(row['START_NODE']), int(row['END_NODE']), float(row['REAL_DURATION']))
+                     for row in trajectory_csv)
+            results = Parallel.imap_ordered(lambda trip: self._find_trip_paths(G, G_reverse, cg, trip), trips,
+                                            self._workers)
 
             i = 0
-            for row in trajectory_csv:
-                trip_id = int(row['TRIP_ID'])
-                print(i / total_rows * 100, '%; trip_id: ', trip_id)
+            execution_times = []
+            max_rss_values = []
+            peak_memories = []
+            for (trip_id, start_node, end_node, paths, execution_time, max_rss, peak_memory) in results:
+                progress = [i / total_rows * 100, '%; trip_id: ', trip_id, '; runtime [s]: ', execution_time]
+                # max rss is the peak of the process that ran the trip so far, it grows on the trips that need more
+                if max_rss is not None:
+                    progress += ['; max rss [MiB]: ', max_rss / 2 ** 20]
+                    max_rss_values.append(max_rss)
+                if peak_memory is not None:
+                    progress += ['; peak memory [MiB]: ', peak_memory / 2 ** 20]
+                    peak_memories.append(peak_memory)
+                print(*progress)
+                execution_times.append(execution_time)
                 i += 1
-                start_node = int(row['START_NODE'])
-                end_node = int(row['END_NODE'])
-                trajectory_duration = float(row['REAL_DURATION'])
-
-                duration_upper_bound = trajectory_duration + (trajectory_duration * self._duration_upper_bound)
-
-                start_time = time.time()
-                paths = self._find_paths(G, start_node, end_node, duration_upper_bound)
-                execution_time = (time.time() - start_time)
 
                 # saving paths
-                trip_output_file_name = os.path.join(self._output_dir_path, str(trip_id) + '.csv')
-                with open(trip_output_file_name, 'w', newline='', encoding='utf-8') as output_file:
-                    w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
-                    w.writeheader()
-                    path_id = 0
-                    for node_path in paths:
-                        (via_path, via_nodes) = node_path
-                        new_row = {'TRIP_ID': trip_id, 'PATH_ID': path_id, 'START_NODE': start_node,
-                                   'END_NODE': end_node, 'NODE_PATH': via_path, 'VIA_NODES': via_nodes,
-                                   'RUNTIME': execution_time}
-                        w.writerow(new_row)
-                        path_id += 1
+                path_store.add_trip(trip_id, [via_path for via_path, _ in paths], execution_time,
+                                    [via_nodes for _, via_nodes in paths], start_node, end_node)
+
+        if execution_times:
+            print('trips:', len(execution_times), 'mean runtime [s]:', sum(execution_times) / len(execution_times),
+                  'max runtime [s]:', max(execution_times))
+        if max_rss_values:
+            print('max rss [MiB]:', max(max_rss_values) / 2 ** 20)
+        if peak_memories:
+            print('max peak memory [MiB]:', max(peak_memories) / 2 ** 20)
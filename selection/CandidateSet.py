@@ -0,0 +1,60 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+from util import HighwayExtractor
+from util.CompactGraph import CompactGraph
+
+
+class CandidateSet(Sequence):
+    """
+    Candidate paths of a trip, e.g. node arrays from the path store, together with per path features.
+
+    Items are the paths as lists of node ids, built again on every access so they are not held next to the node
+    arrays. The per path duration and peaks are cached. With cache_edges the edge positions of a path are cached
+    too, for selections that look at them again after the summaries, e.g. in a fused pass.
+    """
+
+    def __init__(self, cg: CompactGraph, paths: list, cache_edges: bool = False) -> None:
+        self.cg = cg
+        self.path_arrays = paths
+        self._edges = [None] * len(paths) if cache_edges else None
+        self._durations = [None] * len(paths)
+        self._peaks = [None] * len(paths)
+
+    def __len__(self) -> int:
+        return len(self.path_arrays)
+
+    def __getitem__(self, i):
+        path = self.path_arrays[i]
+        return path.tolist() if isinstance(path, np.ndarray) else path
+
+    def edges(self, i: int) -> np.ndarray:
+        """
+        Edge positions in the compact graph along path i.
+        """
+        if self._edges is None:
+            return self.cg.edge_indices(self.path_arrays[i])
+        if self._edges[i] is None:
+            self._edges[i] = self.cg.edge_indices(self.path_arrays[i])
+        return self._edges[i]
+
+    def travel_times(self, i: int) -> np.ndarray:
+        return self.cg.travel_time[self.edges(i)]
+
+    def _summarize(self, i: int) -> None:
+        edges = self.edges(i)
+        travel_times = self.cg.travel_time[edges]
+        # np.cumsum adds in path order, so the duration equals nx.path_weight
+        self._durations[i] = float(np.cumsum(travel_times)[-1]) if len(travel_times) > 0 else 0
+        self._peaks[i] = HighwayExtractor.count_highway_peaks(HighwayExtractor.highway_ranks(self.cg, edges))
+
+    def duration(self, i: int) -> float:
+        if self._durations[i] is None:
+            self._summarize(i)
+        return self._durations[i]
+
+    def peaks(self, i: int) -> int:
+        if self._peaks[i] is None:
+            self._summarize(i)
+        return self._peaks[i]
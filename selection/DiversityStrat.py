@@ -1,61 +1,97 @@
-import ast
 import configparser
-import csv
 
 import networkx as nx
+import numpy as np
+from selection.CandidateSet import CandidateSet
 from selection.SelectionStrategy import SelectionStrategy
-from util import HighwayExtractor
-from util import Util
 
 
-class DiversityStrat(SelectionStrategy):
+def parse_thresholds(text: str) -> list:
+    """
+    >>> parse_thresholds('.1, .3, .7')
+    [0.1, 0.3, 0.7]
+    """
+    return [float(t) for t in text.split(',')]
 
-    def __init__(self, config: configparser.ConfigParser, input_method: str, similarity_threshold: float) -> None:
-        self.result_dir_name = input_method + '-div-' + str(int(similarity_threshold * 100))
-        self.similarity_threshold = similarity_threshold
-        super().__init__(config, input_method)
 
-    def do_selection(self, G: nx.DiGraph, input_reader: csv.DictReader) -> (set, set, bool):
-        vp_path_set = []
+class DiversityStrat(SelectionStrategy):
+    """
+    Diversity filtering for several similarity thresholds, written to one result directory per threshold.
+    """
+    uses_edges = True
 
-        for row in input_reader:
-            lst = ast.literal_eval(row['NODE_PATH'])
+    def __init__(self, config: configparser.ConfigParser, input_method: str, similarity_thresholds: list) -> None:
+        self.result_dir_names = [input_method + '-div-' + str(round(t * 100)) for t in similarity_thresholds]
+        self.similarity_thresholds = similarity_thresholds
+        self._legacy_early_return = config['div'].getboolean('legacy_early_return')
+        super().__init__(config, input_method)
 
-            p = [(u, v, G[u][v]['travel_time']) for u, v in zip(lst[:-1], lst[1:])]
-            w = sum(G[u][v]['travel_time'] for u, v in zip(lst[:-1], lst[1:]))
-            vp_path_set.append((p, w))
+    def do_selection(self, G: nx.DiGraph, candidates: CandidateSet) -> (set, set, bool):
+        return self.do_selections(G, candidates)[0]
 
-        node_set, edge_set = self.diversity_filtering(vp_path_set, self.similarity_threshold)
-        return node_set, edge_set, None
+    def do_selections(self, G: nx.DiGraph, candidates: CandidateSet) -> list:
+        path_edges = [candidates.edges(i) for i in range(len(candidates))]
+        travel_times = [candidates.cg.travel_time[edges] for edges in path_edges]
+        # summed in path order like the sums over edge tuples did, so the weights are identical
+        path_weights = [candidates.duration(i) for i in range(len(candidates))]
 
-    def pathToPathSimilarity(self, path1, path2):
-        commonEdgesDuration = sum([e[2] for e in path1[0] if e in path2[0]])
-        return commonEdgesDuration / min([path1[1], path2[1]])
+        selections = []
+        for accepted in self.diversity_filtering(path_edges, travel_times, path_weights, self.similarity_thresholds):
+            node_set = set()
+            edge_set = set()
+            for i in accepted:
+                path = candidates[i]
+                edge_set.update(zip(path[:-1], path[1:]))
+                if len(path) > 1:
+                    node_set.update(path)
+            selections.append((node_set, edge_set, None))
+        return selections
 
-    def diversity_filtering(self, pathEntries, sim_threshold):
-        pathEntries = sorted(pathEntries, key=lambda tup: tup[1])
-        vp_diverse_path_set = []
-        vp_diverse_node_set = set()
+    def diversity_filtering(self, path_edges: list, travel_times: list, path_weights: list,
+                            sim_thresholds: list) -> list:
+        """
+        Indices of the diverse paths for every threshold. Paths are accepted by increasing travel time if the
+        travel time they share with every accepted path, relative to the faster of both, is at most the threshold.
+        """
+        order = sorted(range(len(path_edges)), key=path_weights.__getitem__)
+        if len(order) == 0:
+            return [[] for _ in sim_thresholds]
+        if self._legacy_early_return:
+            # the filtering used to return after the first path, which kept only the fastest one
+            return [order[:1] for _ in sim_thresholds]
 
-        for pathEntry in pathEntries:
-            if len(vp_diverse_path_set) == 0:
-                vp_diverse_path_set.append(pathEntry)
-                for n in pathEntry[0]:
-                    vp_diverse_node_set.add(n[0])
-                    vp_diverse_node_set.add(n[1])
+        # edges of the paths accepted for any threshold as rows of bitsets over the edges of all candidates of
+        # the trip, so the similarity of a candidate to an accepted path is computed once for all thresholds
+        universe = np.unique(np.concatenate(path_edges))
+        thresholds = np.asarray(sim_thresholds, dtype=np.float64)
+        accepted = [[] for _ in sim_thresholds]
+        num_rows = 0
+        rows = np.zeros((1, len(universe)), dtype=bool)
+        row_weights = np.zeros(1)
+        # row_thresholds[t, r] is set if the path of row r was accepted for threshold t
+        row_thresholds = np.zeros((len(sim_thresholds), 1), dtype=bool)
+        for i in order:
+            local_edges = np.searchsorted(universe, path_edges[i])
+            if num_rows > 0 and len(local_edges) > 0:
+                shared = rows[:num_rows, local_edges]
+                # summed in path order, adding zeros for edges that are not shared does not change the sums
+                common = np.cumsum(np.where(shared, travel_times[i], 0.0), axis=1)[:, -1]
+                similarity = common / np.minimum(path_weights[i], row_weights[:num_rows])
+                too_similar = similarity[np.newaxis, :] > thresholds[:, np.newaxis]
+                accepting = ~(too_similar & row_thresholds[:, :num_rows]).any(axis=1)
             else:
-                toBeAdded = True
-                for p_in in vp_diverse_path_set:
-                    if (self.pathToPathSimilarity(pathEntry, p_in) > sim_threshold):
-                        toBeAdded = False
-                        break
-                if toBeAdded:
-                    vp_diverse_path_set.append(pathEntry)
-                    for n in pathEntry[0]:
-                        vp_diverse_node_set.add(n[0])
-                        vp_diverse_node_set.add(n[1])
-            edge_set = set()
-            for pathEntry in vp_diverse_path_set:
-                for edge in pathEntry[0]:
-                    edge_set.add((edge[0], edge[1]))
-            return vp_diverse_node_set, edge_set
+                accepting = np.ones(len(sim_thresholds), dtype=bool)
+            if not accepting.any():
+                continue
+
+            if num_rows == len(row_weights):
+                rows = np.concatenate((rows, np.zeros_like(rows)))
+                row_weights = np.concatenate((row_weights, np.zeros_like(row_weights)))
+                row_thresholds = np.concatenate((row_thresholds, np.zeros_like(row_thresholds)), axis=1)
+            rows[num_rows, local_edges] = True
+            row_weights[num_rows] = path_weights[i]
+            row_thresholds[:, num_rows] = accepting
+            num_rows += 1
+            for t in np.flatnonzero(accepting).tolist():
+                accepted[t].append(i)
+        return accepted
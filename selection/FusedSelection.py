@@ -0,0 +1,33 @@
+import configparser
+
+import networkx as nx
+from selection.CandidateSet import CandidateSet
+from selection.SelectionStrategy import SelectionStrategy
+
+
+class FusedSelectionStrat(SelectionStrategy):
+    """
+    Runs several selection strategies on the same input method in a single pass. The candidates of every trip are
+    read once and their features are shared, each selector still writes its usual result file.
+    """
+
+    def __init__(self, config: configparser.ConfigParser, input_method: str, selectors: list) -> None:
+        for selector in selectors:
+            if selector.input_method != input_method:
+                raise ValueError('Selector ' + type(selector).__name__ + ' runs on ' + selector.input_method +
+                                 ', not on ' + input_method)
+        self._selectors = selectors
+        self.result_dir_names = [name for selector in selectors for name in selector.result_dir_names]
+        self.uses_edges = any(selector.uses_edges for selector in selectors)
+        super().__init__(config, input_method)
+
+    def set_resources(self, resources) -> None:
+        super().set_resources(resources)
+        for selector in self._selectors:
+            selector.set_resources(resources)
+
+    def do_selection(self, G: nx.DiGraph, candidates: CandidateSet) -> (set, set, bool):
+        return self.do_selections(G, candidates)[0]
+
+    def do_selections(self, G: nx.DiGraph, candidates: CandidateSet) -> list:
+        return [selection for selector in self._selectors for selection in selector.do_selections(G, candidates)]
@@ -1,33 +1,32 @@
-import ast
 import configparser
-import csv
 
 import networkx as nx
+from selection.CandidateSet import CandidateSet
 from selection.SelectionStrategy import SelectionStrategy
-from util import HighwayExtractor
 from util import Util
 
 
 class LocalOptimalityStrat(SelectionStrategy):
+    uses_edges = True
 
     def __init__(self, config: configparser.ConfigParser, input_method: str) -> None:
         self.result_dir_name = input_method + '-lopt'
         self.alpha = float(config['lopt']['optimality_T'])
+        self._engine = config['graph']['engine']
         super().__init__(config, input_method)
 
-    def do_selection(self, G: nx.DiGraph, input_reader: csv.DictReader) -> (set, set, bool):
+    def do_selection(self, G: nx.DiGraph, candidates: CandidateSet) -> (set, set, bool):
         node_set = set()
         edge_set = set()
         replaced = False
-        for row in input_reader:
-            path = ast.literal_eval(row['NODE_PATH'])
-
+        cg = candidates.cg if self._engine == 'compact' else None
+        for path_index, path in enumerate(candidates):
             path_edges = []
             for i in range(0, len(path) - 1):
                 e = (path[i], path[i + 1])
                 path_edges.append(e)
 
-            is_optimal = Util.is_locally_optimal(G, path, self.alpha)
+            is_optimal = Util.is_locally_optimal(G, path, self.alpha, cg, candidates.travel_times(path_index))
             if is_optimal:
                 replaced = True
                 for node in path:
@@ -1,10 +1,8 @@
-import ast
 import configparser
-import csv
 
 import networkx as nx
+from selection.CandidateSet import CandidateSet
 from selection.SelectionStrategy import SelectionStrategy
-from util import HighwayExtractor
 
 
 class MinPeaksStrat(SelectionStrategy):
@@ -13,41 +11,23 @@ class MinPeaksStrat(SelectionStrategy):
         self.result_dir_name = input_method + '-minp'
         super().__init__(config, input_method)
 
-    def do_selection(self, G: nx.DiGraph, input_reader: csv.DictReader) -> (set, set, bool):
-        min_value = None
-        res_path = None
-        res_edges = None
-
-        first_path = True
-        replaced = False
-
-        for row in input_reader:
-            path = ast.literal_eval(row['NODE_PATH'])
-
-            path_edges = []
-            for i in range(0, len(path) - 1):
-                e = (path[i], path[i + 1])
-                path_edges.append(e)
-
-            highway_types = HighwayExtractor.calculate_highway_types(G, path)
-            num_peaks = HighwayExtractor.calculate_highway_peaks(highway_types)
-            if first_path:
+    def do_selection(self, G: nx.DiGraph, candidates: CandidateSet) -> (set, set, bool):
+        if len(candidates) == 0:
+            return set(), set(), False
+
+        # the first path with the fewest peaks wins. the scan stops once a path with at most one peak is found,
+        # so only the peak counts of the scanned paths are computed and only the winner's node list is built
+        winner = 0
+        min_value = candidates.peaks(0)
+        i = 1
+        while min_value > 1 and i < len(candidates):
+            num_peaks = candidates.peaks(i)
+            if num_peaks < min_value:
+                winner = i
                 min_value = num_peaks
-                first_path = False
-                res_path = path
-                res_edges = path_edges
-                if min_value == 0:
-                    break
-
-            elif (min_value > 0) and (num_peaks < min_value):
-                min_value = num_peaks
-                res_path = path
-                res_edges = path_edges
-                replaced = True
-
-            if min_value == 1:
-                break
+            i += 1
 
-        node_set = set(res_path)
-        edge_set = set(res_edges)
-        return node_set, edge_set, replaced
+        path = candidates[winner]
+        node_set = set(path)
+        edge_set = set(zip(path[:-1], path[1:]))
+        return node_set, edge_set, winner > 0
@@ -1,8 +1,7 @@
-import ast
 import configparser
-import csv
 
 import networkx as nx
+from selection.CandidateSet import CandidateSet
 from selection.SelectionStrategy import SelectionStrategy
 
 
@@ -12,12 +11,10 @@ class SelectAllStrat(SelectionStrategy):
         self.result_dir_name = input_method + '-all'
         super().__init__(config, input_method)
 
-    def do_selection(self, G: nx.DiGraph, input_reader: csv.DictReader) -> (set, set, bool):
+    def do_selection(self, G: nx.DiGraph, candidates: CandidateSet) -> (set, set, bool):
         node_set = set()
         edge_set = set()
-        for row in input_reader:
-            path = ast.literal_eval(row['NODE_PATH'])
-
+        for path in candidates:
             path_edges = []
             for i in range(0, len(path) - 1):
                 e = (path[i], path[i + 1])
@@ -4,49 +4,79 @@ import configparser
 import csv
 import os
 from abc import abstractmethod
+from contextlib import ExitStack
 
 import networkx as nx
-import osmnx as ox
 from Strategy import Strategy
-from sklearn.metrics import precision_score, recall_score
 
-from evaluation import EvalUtil
+from evaluation import Metrics
+from selection.CandidateSet import CandidateSet
+from util import PathStore
 
 
 class SelectionStrategy(Strategy):
+    # strategies that select in several ways at once set one result directory per selection
+    result_dir_names = None
+    # strategies that read the edges of the candidates after their summaries set this to cache them per trip
+    uses_edges = False
 
     def __init__(self, config: configparser.ConfigParser, input_method: str) -> None:
         base_resource_path = config['DEFAULT']['base_resource_path']
+        self.input_method = input_method
         self.train_file_name = config['DEFAULT']['train_file_name']
         fmm_output_path = config['fmm']['output_path']
         input_method_output_path = config[input_method]['output_path']
 
         self._input_method_output_file_path = os.path.join(input_method_output_path, self.train_file_name)
         self._train_file_path = os.path.join(fmm_output_path, self.train_file_name)
-        self._output_path = os.path.join(base_resource_path, self.result_dir_name)
-        self._output_file_path = os.path.join(self._output_path, self.train_file_name)
+        if self.result_dir_names is None:
+            self.result_dir_names = [self.result_dir_name]
+        self._output_paths = [os.path.join(base_resource_path, name) for name in self.result_dir_names]
+        self._output_file_paths = [os.path.join(path, self.train_file_name) for path in self._output_paths]
         self._graphml_file_path = config['osm']['graphml_file_path']
+        self._ground_truth_cache_path = config['eval-gt']['cache_path']
+        self._strict_parsing = config['DEFAULT'].getboolean('strict_parsing')
 
     @abstractmethod
-    def do_selection(self, G: nx.DiGraph, input_reader: csv.DictReader) -> (set, set, bool):
+    def do_selection(self, G: nx.DiGraph, candidates: CandidateSet) -> (set, set, bool):
+        """
+        Select from the candidate paths of a trip. candidates is a sequence of paths as lists of node ids.
+        """
         pass
 
+    def do_selections(self, G: nx.DiGraph, candidates: CandidateSet) -> list:
+        """
+        Results of do_selection for every entry of result_dir_names.
+        """
+        return [self.do_selection(G, candidates)]
+
     def do_algorithm(self) -> None:
-        G = ox.load_graphml(self._graphml_file_path)
-        G = ox.get_digraph(G, weight='length')
-        G_nodes = list(G.nodes)
+        # G is built from the compact graph, which also holds edge attributes as arrays for the candidate features
+        cg = self.resources.compact_graph(self._graphml_file_path, weight='length')
+        G = self.resources.digraph(self._graphml_file_path, weight='length')
+        G_nodes = set(G.nodes)
+
+        gt = self.resources.ground_truth(G, self._train_file_path, self._graphml_file_path,
+                                         self._ground_truth_cache_path, self._strict_parsing)
+
+        candidate_paths = PathStore.open_paths(self._input_method_output_file_path, self._strict_parsing)
 
         total_rows = sum(1 for _ in open(self._train_file_path)) - 1
 
-        if not os.path.exists(self._output_path):
-            os.makedirs(self._output_path)
-        with open(self._train_file_path, newline='', encoding='utf-8') as train_file, \
-                open(self._output_file_path, 'w', newline='', encoding='utf-8') as output_file:
+        for output_path in self._output_paths:
+            if not os.path.exists(output_path):
+                os.makedirs(output_path)
+        with open(self._train_file_path, newline='', encoding='utf-8') as train_file, ExitStack() as stack:
+            output_files = [stack.enter_context(open(output_file_path, 'w', newline='', encoding='utf-8'))
+                            for output_file_path in self._output_file_paths]
 
             fieldnames = ['TRIP_ID', 'PRECISION', 'RECALL', 'RECALLATN', 'ACCURACY', 'REPLACED', 'NODE_SET']
-            w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"',
-                               quoting=csv.QUOTE_ALL)
-            w.writeheader()
+            writers = []
+            for output_file in output_files:
+                w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"',
+                                   quoting=csv.QUOTE_ALL)
+                w.writeheader()
+                writers.append(w)
 
             train_csv = csv.DictReader(train_file, delimiter=',')
             i = 0
@@ -55,30 +85,20 @@ class SelectionStrategy(Strategy):
                 print(i / total_rows * 100, '%; trip_id: ', trip_id)
                 i += 1
 
-                (tripIds, gt_path_vectors, gt_path_edges, gt_path_lengths, tripsTimestamps, tripsErrors,
-                 errorList) = EvalUtil.calculate_groud_truth(G, self._train_file_path)
-
-                input_path = os.path.join(self._input_method_output_file_path, str(trip_id) + '.csv')
-                with open(input_path, newline='') as input_csv:
-                    input_reader = csv.DictReader(input_csv, delimiter=',', quotechar='"')
-
-                    node_set, edge_set, replaced = self.do_selection(G, input_reader)
-
-                    tempVector = EvalUtil.get_path_vector_from_nodes(G_nodes, node_set)
-
-                    precision = precision_score(gt_path_vectors[trip_id], tempVector)
-                    recall = recall_score(gt_path_vectors[trip_id], tempVector)
+                gt_path_nodes = gt.path_nodes(trip_id)
+                gt_path_edges = set(gt.path_edges[trip_id])
+                gt_path_length = gt.path_lengths[trip_id]
 
-                    pathLength = 0
-                    intersectionLength = 0
-                    for e in edge_set:
-                        pathLength += G.edges[e[0], e[1]]['length']
-                        if e in gt_path_edges[trip_id]:
-                            intersectionLength += G.edges[e[0], e[1]]['length']
+                candidates = CandidateSet(cg, candidate_paths.path_arrays(trip_id), cache_edges=self.uses_edges)
+                selections = self.do_selections(G, candidates)
 
-                    recall_at_n = intersectionLength / gt_path_lengths[trip_id]
-                    accuracy = intersectionLength / max(gt_path_lengths[trip_id], pathLength)
+                for w, (node_set, edge_set, replaced) in zip(writers, selections):
+                    edge_lengths = [G.edges[e[0], e[1]]['length'] for e in edge_set]
+                    precision, recall, recall_at_n, accuracy = Metrics.score(gt_path_nodes, node_set, gt_path_edges,
+                                                                             edge_set, edge_lengths, gt_path_length,
+                                                                             universe=G_nodes)
 
-                    new_row = {'TRIP_ID': trip_id, 'PRECISION': precision, 'RECALL': recall, 'RECALLATN': recall_at_n,
-                               'ACCURACY': accuracy, 'REPLACED': replaced, 'NODE_SET': node_set}
+                    new_row = {'TRIP_ID': trip_id, 'PRECISION': precision, 'RECALL': recall,
+                               'RECALLATN': recall_at_n, 'ACCURACY': accuracy, 'REPLACED': replaced,
+                               'NODE_SET': node_set}
                     w.writerow(new_row)
@@ -1,10 +1,25 @@
-import ast
 import configparser
-import csv
 
 import networkx as nx
+import numpy as np
+from selection.CandidateSet import CandidateSet
 from selection.SelectionStrategy import SelectionStrategy
-from util import HighwayExtractor
+
+
+def skyline(durations: np.ndarray, peaks: np.ndarray) -> np.ndarray:
+    """
+    Indices of the paths with fewer peaks than every faster path, by increasing duration. Paths of equal duration
+    keep their order.
+
+    >>> skyline(np.array([3.0, 1.0, 2.0, 4.0]), np.array([0, 3, 3, 1]))
+    array([1, 0])
+    """
+    order = np.argsort(durations, kind='stable')
+    sorted_peaks = peaks[order]
+    fewest_before = np.empty(len(order), dtype=sorted_peaks.dtype)
+    fewest_before[:1] = np.iinfo(sorted_peaks.dtype).max
+    np.minimum.accumulate(sorted_peaks[:-1], out=fewest_before[1:])
+    return order[sorted_peaks < fewest_before]
 
 
 class SkylineStrat(SelectionStrategy):
@@ -13,46 +28,21 @@ class SkylineStrat(SelectionStrategy):
         self.result_dir_name = input_method + '-skyline'
         super().__init__(config, input_method)
 
-    def do_selection(self, G: nx.DiGraph, input_reader: csv.DictReader) -> (set, set, bool):
-        path_list = []
-        for row in input_reader:
-            path = ast.literal_eval(row['NODE_PATH'])
-            distance = nx.path_weight(G, path, 'travel_time')
-            highway_types = HighwayExtractor.calculate_highway_types(G, path)
-            num_peaks = HighwayExtractor.calculate_highway_peaks(highway_types)
-            path_tuple = (path, distance, num_peaks)
-            path_list.append(path_tuple)
-
-        path_list.sort(key=lambda y: y[1])
-
-        min_value = None
-        # res_path = []
-        node_set = None
-        edge_set = None
-
-        first_path = True
-        replaced = False
-
-        for path in path_list:
-
-            path_edges = []
-            for i in range(0, len(path[0]) - 1):
-                e = (path[0][i], path[0][i + 1])
-                path_edges.append(e)
-
-            if first_path:
-                first_path = False
-                min_value = path[2]
-                # res_path.append(path[0])
-                node_set = set(path[0])
-                edge_set = set(path_edges)
-            elif path[2] < min_value:
-                min_value = path[2]
-                replaced = True
-                # res_path.append(path[0])
-                for node in path[0]:
-                    node_set.add(node)
-                for edge in path_edges:
-                    edge_set.add(edge)
-
-        return node_set, edge_set, replaced
+    def do_selection(self, G: nx.DiGraph, candidates: CandidateSet) -> (set, set, bool):
+        if len(candidates) == 0:
+            return set(), set(), False
+
+        # only the summaries of the paths are kept, node lists are built for the skyline paths alone
+        durations = np.fromiter((candidates.duration(i) for i in range(len(candidates))), dtype=np.float64,
+                                count=len(candidates))
+        peaks = np.fromiter((candidates.peaks(i) for i in range(len(candidates))), dtype=np.int64,
+                            count=len(candidates))
+
+        node_set = set()
+        edge_set = set()
+        winners = skyline(durations, peaks).tolist()
+        for i in winners:
+            path = candidates[i]
+            node_set.update(path)
+            edge_set.update(zip(path[:-1], path[1:]))
+        return node_set, edge_set, len(winners) > 1
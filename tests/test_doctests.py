@@ -0,0 +1,11 @@
+import doctest
+import importlib
+
+# modules with examples in their docstrings
+MODULES = ['selection.DiversityStrat', 'selection.Skyline', 'util.HighwayExtractor', 'util.PathParser', 'util.Util']
+
+
+def load_tests(loader, tests, ignore):
+    for name in MODULES:
+        tests.addTests(doctest.DocTestSuite(importlib.import_module(name)))
+    return tests
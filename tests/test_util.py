@@ -0,0 +1,28 @@
+import unittest
+
+import pandas as pd
+
+from util import Util
+
+
+class BuildSpeedLimitLookupTest(unittest.TestCase):
+
+    def test_first_speed_limit_of_an_edge_wins(self):
+        speed_limits = pd.DataFrame({'source': [1, 2, 1, 1], 'target': [2, 3, 2, 2],
+                                     'speed_kph': [50.0, 90.0, 30.0, 70.0]})
+        self.assertEqual(Util.build_speed_limit_lookup(speed_limits), {(1, 2): 50.0, (2, 3): 90.0})
+
+    def test_edges_are_directed(self):
+        speed_limits = pd.DataFrame({'source': [1, 2], 'target': [2, 1], 'speed_kph': [50.0, 30.0]})
+        self.assertEqual(Util.build_speed_limit_lookup(speed_limits), {(1, 2): 50.0, (2, 1): 30.0})
+
+    def test_node_ids_are_ints(self):
+        # pandas reads the ids as floats if a column has missing values elsewhere
+        speed_limits = pd.DataFrame({'source': [1.0], 'target': [2.0], 'speed_kph': [50.0]})
+        lookup = Util.build_speed_limit_lookup(speed_limits)
+        self.assertEqual(lookup, {(1, 2): 50.0})
+        self.assertIsInstance(next(iter(lookup))[0], int)
+
+
+if __name__ == '__main__':
+    unittest.main()
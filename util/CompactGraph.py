@@ -0,0 +1,527 @@
+import math
+from heapq import heappop, heappush
+from itertools import count
+
+import networkx as nx
+import numpy as np
+
+from util import HighwayExtractor
+
+WEIGHTS = ('length', 'travel_time')
+
+HIGHWAY_TYPES = HighwayExtractor.HIGHWAY_TYPES
+
+
+def _first(value):
+    # osmnx stores merged attributes as lists
+    if isinstance(value, list):
+        return value[0]
+    return value
+
+
+class CompactGraph:
+    """
+    Read-only CSR representation of a road network digraph.
+
+    Nodes are numbered 0..n-1 in the iteration order of the source digraph and the outgoing edges of each node
+    keep their adjacency order. dijkstra mirrors networkx's single source Dijkstra and bidirectional_dijkstra its
+    bidirectional one, which nx.shortest_path uses between two nodes. Each finds the same paths as its networkx
+    counterpart, including ties, but the two searches can break ties differently from each other. Edge attributes
+    are stored as arrays indexed by CSR edge position.
+    """
+
+    def __init__(self, node_ids: np.ndarray, offsets: np.ndarray, targets: np.ndarray, length: np.ndarray,
+                 travel_time: np.ndarray, highway_rank: np.ndarray, osmid: np.ndarray) -> None:
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.length = length
+        self.travel_time = travel_time
+        self.highway_rank = highway_rank
+        self.osmid = osmid
+
+        self.sources = np.repeat(np.arange(len(node_ids), dtype=np.int64), np.diff(offsets))
+
+        self._index = None
+        self._sorted_node_ids = None
+        self._edge_keys = None
+        self._reverse = None
+        self._lists = {}
+
+    @classmethod
+    def from_digraph(cls, G: nx.DiGraph) -> 'CompactGraph':
+        node_ids = np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes())
+        index = {n: i for i, n in enumerate(G.nodes)}
+
+        num_edges = G.number_of_edges()
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        targets = np.empty(num_edges, dtype=np.int64)
+        length = np.empty(num_edges, dtype=np.float64)
+        travel_time = np.empty(num_edges, dtype=np.float64)
+        highway_rank = np.empty(num_edges, dtype=np.int8)
+        osmid = np.empty(num_edges, dtype=np.int64)
+
+        e = 0
+        for i, (u, neighbors) in enumerate(G.adjacency()):
+            for v, data in neighbors.items():
+                targets[e] = index[v]
+                # networkx uses a weight of 1 for edges without the attribute
+                length[e] = data.get('length', 1)
+                travel_time[e] = data.get('travel_time', 1)
+                highway = data.get('highway')
+                if highway is None:
+                    highway_rank[e] = 0
+                else:
+                    highway_rank[e] = HighwayExtractor.HIGHWAY_HIERARCHY[HighwayExtractor.clean_highway_types(highway)]
+                osmid[e] = int(_first(data.get('osmid', -1)))
+                e += 1
+            offsets[i + 1] = e
+
+        cg = cls(node_ids, offsets, targets, length, travel_time, highway_rank, osmid)
+        cg._index = index
+        return cg
+
+    def to_digraph(self) -> nx.DiGraph:
+        """
+        Build a networkx digraph with the stored attributes, e.g. to validate results against networkx.
+        """
+        G = nx.DiGraph()
+        node_ids = self.node_ids.tolist()
+        G.add_nodes_from(node_ids)
+        sources = self.sources.tolist()
+        targets = self.targets.tolist()
+        length = self.length.tolist()
+        travel_time = self.travel_time.tolist()
+        highway_rank = self.highway_rank.tolist()
+        osmid = self.osmid.tolist()
+        G.add_edges_from((node_ids[sources[e]], node_ids[targets[e]],
+                          {'length': length[e], 'travel_time': travel_time[e],
+                           'highway': HIGHWAY_TYPES[highway_rank[e]], 'osmid': osmid[e]})
+                         for e in range(len(targets)))
+        return G
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def number_of_edges(self) -> int:
+        return len(self.targets)
+
+    @property
+    def index(self) -> dict:
+        # node id -> node index
+        if self._index is None:
+            self._index = {n: i for i, n in enumerate(self.node_ids.tolist())}
+        return self._index
+
+    def _list(self, name: str) -> list:
+        # python lists are a lot faster than numpy arrays for element access in the Dijkstra loop
+        lst = self._lists.get(name)
+        if lst is None:
+            lst = getattr(self, name).tolist()
+            self._lists[name] = lst
+        return lst
+
+    def weights(self, weight: str) -> list:
+        if weight not in WEIGHTS:
+            raise ValueError('Unknown weight: ' + weight)
+        return self._list(weight)
+
+    def _reverse_csr(self) -> (list, list, list):
+        # incoming edges of every node, in the order networkx' DiGraph.reverse() would store them
+        if self._reverse is None:
+            order = np.argsort(self.targets, kind='stable')
+            rev_offsets = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=len(self.node_ids)), out=rev_offsets[1:])
+            self._reverse = (rev_offsets.tolist(), order.tolist(), self.sources[order].tolist())
+        return self._reverse
+
+    def _forward_csr(self) -> (list, list, list):
+        return self._list('offsets'), range(len(self.targets)), self._list('targets')
+
+    def node_indices(self, nodes) -> np.ndarray:
+        """
+        Node indices of a list or array of node ids.
+        """
+        if self._sorted_node_ids is None:
+            order = np.argsort(self.node_ids)
+            self._sorted_node_ids = (self.node_ids[order], order)
+        sorted_ids, order = self._sorted_node_ids
+
+        nodes = np.asarray(nodes, dtype=np.int64)
+        positions = np.searchsorted(sorted_ids, nodes)
+        positions[positions == len(sorted_ids)] = 0
+        missing = sorted_ids[positions] != nodes
+        if missing.any():
+            raise nx.NodeNotFound(f'Node {nodes[np.argmax(missing)]} not in graph')
+        return order[positions]
+
+    def edge_indices(self, path) -> np.ndarray:
+        """
+        CSR edge positions of the edges along a path of node ids, given as list or array.
+        """
+        if self._edge_keys is None:
+            keys = self.sources * len(self.node_ids) + self.targets
+            order = np.argsort(keys)
+            self._edge_keys = (keys[order], order)
+        sorted_keys, order = self._edge_keys
+
+        nodes = self.node_indices(path)
+        keys = nodes[:-1] * len(self.node_ids) + nodes[1:]
+        positions = np.searchsorted(sorted_keys, keys)
+        positions[positions == len(sorted_keys)] = 0
+        missing = sorted_keys[positions] != keys
+        if missing.any():
+            i = int(np.argmax(missing))
+            raise KeyError((path[i], path[i + 1]))
+        return order[positions]
+
+    def path_weight(self, path: list, weight: str) -> float:
+        weights = self.weights(weight)
+        cost = 0
+        for e in self.edge_indices(path).tolist():
+            cost += weights[e]
+        return cost
+
+    def dijkstra(self, source: int, target: int = None, weight: str = 'travel_time', cutoff: float = None,
+                 weights: list = None, reverse: bool = False) -> (dict, dict):
+        """
+        Dijkstra from a node index, following networkx' tie-breaking.
+
+        weights overrides the edge weights with a list indexed by edge position. With reverse=True the search
+        follows incoming edges, like networkx on G.reverse(). Returns the distances and, for every reached node
+        except the source, the edge it was reached by.
+        """
+        if weights is None:
+            weights = self.weights(weight)
+        offsets, edges, neighbors = self._reverse_csr() if reverse else self._forward_csr()
+
+        dist = {}
+        seen = {source: 0}
+        pred_edge = {}
+        c = count()
+        fringe = [(0, next(c), source)]
+        while fringe:
+            (dist_v, _, v) = heappop(fringe)
+            if v in dist:
+                continue
+            dist[v] = dist_v
+            if v == target:
+                break
+            for k in range(offsets[v], offsets[v + 1]):
+                e = edges[k]
+                u = neighbors[k]
+                vu_dist = dist_v + weights[e]
+                if cutoff is not None and vu_dist > cutoff:
+                    continue
+                if u in dist:
+                    if vu_dist < dist[u]:
+                        raise ValueError("Contradictory paths found:", "negative weights?")
+                elif u not in seen or vu_dist < seen[u]:
+                    seen[u] = vu_dist
+                    heappush(fringe, (vu_dist, next(c), u))
+                    pred_edge[u] = e
+        return dist, pred_edge
+
+    def astar(self, source: int, target: int, heuristic: dict, default_heuristic: float = 0,
+              weight: str = 'travel_time', weights: list = None) -> (dict, dict):
+        """
+        A* from a node index to target. heuristic maps node indices to lower bounds of their distance to target,
+        nodes without an entry get default_heuristic. The bounds must be consistent, then every node is final
+        once it is settled. Returns the distances of the settled nodes and pred edges like dijkstra.
+        """
+        if weights is None:
+            weights = self.weights(weight)
+        offsets, edges, neighbors = self._forward_csr()
+
+        dist = {}
+        seen = {source: 0}
+        pred_edge = {}
+        c = count()
+        fringe = [(heuristic.get(source, default_heuristic), next(c), source)]
+        while fringe:
+            (_, _, v) = heappop(fringe)
+            if v in dist:
+                continue
+            dist_v = seen[v]
+            dist[v] = dist_v
+            if v == target:
+                break
+            for k in range(offsets[v], offsets[v + 1]):
+                e = edges[k]
+                u = neighbors[k]
+                if u in dist:
+                    continue
+                vu_dist = dist_v + weights[e]
+                if u not in seen or vu_dist < seen[u]:
+                    seen[u] = vu_dist
+                    heappush(fringe, (vu_dist + heuristic.get(u, default_heuristic), next(c), u))
+                    pred_edge[u] = e
+        return dist, pred_edge
+
+    def bidirectional_dijkstra(self, source: int, target: int, weight: str = 'travel_time',
+                               weights: list = None) -> (float, list):
+        """
+        Bidirectional Dijkstra between node indices, following the tie-breaking of nx.bidirectional_dijkstra.
+        Returns the distance and the node indices of the path.
+        """
+        if weights is None:
+            weights = self.weights(weight)
+        return self._bidirectional_search(source, target, weights)
+
+    def _bidirectional_search(self, source: int, target: int, weights: list, bounds: list = None):
+        # bounds holds a dict of largest distances from the source and one of largest distances to the target. the
+        # search returns None as soon as a node in them is settled closer, i.e. a shorter path to it exists
+        if source == target:
+            return 0, [source]
+        # [forward, backward], the backward search follows incoming edges like networkx does with G._pred
+        csr = [self._forward_csr(), self._reverse_csr()]
+        dists = [{}, {}]
+        preds = [{source: None}, {target: None}]
+        seen = [{source: 0}, {target: 0}]
+        fringe = [[], []]
+        c = count()
+        heappush(fringe[0], (0, next(c), source))
+        heappush(fringe[1], (0, next(c), target))
+
+        finaldist = None
+        meetnode = None
+        direction = 1
+        while fringe[0] and fringe[1]:
+            direction = 1 - direction
+            (dist_v, _, v) = heappop(fringe[direction])
+            if v in dists[direction]:
+                continue
+            dists[direction][v] = dist_v
+            if bounds is not None and v in bounds[direction] and dist_v < bounds[direction][v]:
+                return None
+            if v in dists[1 - direction]:
+                path = []
+                node = meetnode
+                while node is not None:
+                    path.append(node)
+                    node = preds[0][node]
+                path.reverse()
+                node = preds[1][meetnode]
+                while node is not None:
+                    path.append(node)
+                    node = preds[1][node]
+                return finaldist, path
+
+            offsets, edges, neighbors = csr[direction]
+            dist_d = dists[direction]
+            seen_d = seen[direction]
+            seen_other = seen[1 - direction]
+            for k in range(offsets[v], offsets[v + 1]):
+                u = neighbors[k]
+                vu_dist = dist_v + weights[edges[k]]
+                if u in dist_d:
+                    if vu_dist < dist_d[u]:
+                        raise ValueError("Contradictory paths found: negative weights?")
+                elif u not in seen_d or vu_dist < seen_d[u]:
+                    seen_d[u] = vu_dist
+                    heappush(fringe[direction], (vu_dist, next(c), u))
+                    preds[direction][u] = v
+                    if u in seen_other:
+                        finaldist_u = vu_dist + seen_other[u]
+                        if finaldist is None or finaldist > finaldist_u:
+                            finaldist, meetnode = finaldist_u, u
+        raise nx.NetworkXNoPath(f'No path between {source} and {target}.')
+
+    def is_shortest_path(self, path: list, weight: str = 'travel_time') -> bool:
+        """
+        Check if shortest_path(path[0], path[-1], weight) returns path, for a path of node ids. The bidirectional
+        search stops as soon as a node of path is settled closer to the source or target than along path.
+        """
+        index = self.index
+        nodes = [index[n] for n in path]
+        if len(set(nodes)) != len(nodes):
+            return False
+        weights = self.weights(weight)
+        costs = [0]
+        for e in self.edge_indices(path).tolist():
+            costs.append(costs[-1] + weights[e])
+        # sums along different paths of equal cost may differ in the last bits, these are left to the comparison
+        tolerance = costs[-1] * 1e-9
+        bounds = [{node: cost - tolerance for node, cost in zip(nodes, costs)},
+                  {node: costs[-1] - cost - tolerance for node, cost in zip(nodes, costs)}]
+        result = self._bidirectional_search(nodes[0], nodes[-1], weights, bounds)
+        return result is not None and result[1] == nodes
+
+    def _spur_search(self, source: int, target: int, heuristic: dict, weights: list, cutoff: float,
+                     ignore_nodes: set, ignore_edges: set) -> (float, list):
+        # A* for the spur paths of k_shortest_paths. nodes without a lower bound can not reach the target within
+        # the cost bound of the search and are skipped
+        offsets, edges, neighbors = self._forward_csr()
+
+        dist = {}
+        seen = {source: 0}
+        pred_edge = {}
+        c = count()
+        fringe = [(heuristic[source], next(c), source)]
+        while fringe:
+            (_, _, v) = heappop(fringe)
+            if v in dist:
+                continue
+            dist_v = seen[v]
+            dist[v] = dist_v
+            if v == target:
+                return dist_v, self.edges_to(pred_edge, target)
+            for k in range(offsets[v], offsets[v + 1]):
+                e = edges[k]
+                u = neighbors[k]
+                if u in dist or u in ignore_nodes or e in ignore_edges or u not in heuristic:
+                    continue
+                vu_dist = dist_v + weights[e]
+                estimate = vu_dist + heuristic[u]
+                if estimate > cutoff:
+                    continue
+                if u not in seen or vu_dist < seen[u]:
+                    seen[u] = vu_dist
+                    heappush(fringe, (estimate, next(c), u))
+                    pred_edge[u] = e
+        return None, None
+
+    def k_shortest_paths(self, source: int, target: int, weight: str = 'travel_time', max_cost: float = None,
+                         weights: list = None):
+        """
+        Generate the simple paths from source to target by increasing cost, like nx.shortest_simple_paths, as
+        (cost, node indices) tuples. Stops after the last path with a cost of at most max_cost.
+
+        Uses Yen's algorithm with Lawler's improvement: paths only deviate from their parent at or after the node
+        where the parent deviated from its own parent. Spur paths are searched with A*, bounded by the exact
+        distances to target and max_cost. Paths of equal cost can be generated in a different order than by
+        networkx.
+        """
+        if weights is None:
+            weights = self.weights(weight)
+        cutoff = math.inf if max_cost is None else max_cost
+        # distances to target stay lower bounds when nodes and edges are ignored
+        heuristic, _ = self.dijkstra(target, weight=weight, cutoff=max_cost, weights=weights, reverse=True)
+        if source not in heuristic:
+            return
+
+        # prefix tree of the accepted paths. trie node i stands for a path prefix and maps the next edge to the
+        # trie node of the extended prefix, so the edges to ignore at a spur node are the keys of its trie node
+        trie = [{}]
+        candidates = []
+        candidate_paths = set()
+        c = count()
+
+        cost, edges = self._spur_search(source, target, heuristic, weights, cutoff, set(), set())
+        if edges is None:
+            return
+        heappush(candidates, (cost, next(c), edges, 0))
+        while candidates:
+            _, _, edges, deviation = heappop(candidates)
+
+            cost = 0
+            for e in edges:
+                cost += weights[e]
+            nodes = self.edge_path_nodes(source, edges)
+            yield cost, nodes
+
+            trie_nodes = [0]
+            for e in edges:
+                child = trie[trie_nodes[-1]].get(e)
+                if child is None:
+                    child = len(trie)
+                    trie.append({})
+                    trie[trie_nodes[-1]][e] = child
+                trie_nodes.append(child)
+
+            root_cost = 0
+            for i in range(deviation):
+                root_cost += weights[edges[i]]
+            for i in range(deviation, len(edges)):
+                spur_cost, spur_edges = self._spur_search(nodes[i], target, heuristic, weights, cutoff - root_cost,
+                                                          set(nodes[:i]), set(trie[trie_nodes[i]]))
+                if spur_edges is not None:
+                    candidate = tuple(edges[:i]) + tuple(spur_edges)
+                    if candidate not in candidate_paths:
+                        candidate_paths.add(candidate)
+                        heappush(candidates, (root_cost + spur_cost, next(c), list(candidate), i))
+                root_cost += weights[edges[i]]
+
+    def path_to(self, pred_edge: dict, node: int, reverse: bool = False) -> list:
+        """
+        Node indices of the path from the search source to node. For a reverse search the path runs from node
+        to the search source.
+        """
+        path = [node]
+        if reverse:
+            targets = self._list('targets')
+            while node in pred_edge:
+                node = targets[pred_edge[node]]
+                path.append(node)
+        else:
+            sources = self._list('sources')
+            while node in pred_edge:
+                node = sources[pred_edge[node]]
+                path.append(node)
+            path.reverse()
+        return path
+
+    def edge_endpoints(self) -> (list, list):
+        """
+        Source and target node indices of all edges, indexed by edge position.
+        """
+        return self._list('sources'), self._list('targets')
+
+    def edges_to(self, pred_edge: dict, node: int, reverse: bool = False) -> list:
+        """
+        Like path_to, but returns the edge positions along the path.
+        """
+        edges = []
+        if reverse:
+            targets = self._list('targets')
+            while node in pred_edge:
+                e = pred_edge[node]
+                edges.append(e)
+                node = targets[e]
+        else:
+            sources = self._list('sources')
+            while node in pred_edge:
+                e = pred_edge[node]
+                edges.append(e)
+                node = sources[e]
+            edges.reverse()
+        return edges
+
+    def edge_path_nodes(self, source: int, edges: list) -> list:
+        """
+        Node indices of the path that starts at source and follows the given edge positions.
+        """
+        targets = self._list('targets')
+        return [source] + [targets[e] for e in edges]
+
+    def to_node_ids(self, path: list) -> list:
+        node_ids = self._list('node_ids')
+        return [node_ids[i] for i in path]
+
+    def shortest_path(self, source, target, weight: str = 'travel_time') -> list:
+        """
+        Drop-in for nx.shortest_path(G, source, target, weight=weight) taking and returning node ids. Like networkx
+        it searches bidirectionally, so ties can break differently than in single_source_dijkstra.
+        """
+        index = self.index
+        if source not in index:
+            raise nx.NodeNotFound(f'Source {source} is not in G')
+        if target not in index:
+            raise nx.NodeNotFound(f'Target {target} is not in G')
+        try:
+            _, path = self.bidirectional_dijkstra(index[source], index[target], weight=weight)
+        except nx.NetworkXNoPath:
+            raise nx.NetworkXNoPath(f'No path between {source} and {target}.')
+        return self.to_node_ids(path)
+
+    def single_source_dijkstra(self, source, target, weight: str = 'travel_time', weights: list = None) -> tuple:
+        """
+        Drop-in for nx.single_source_dijkstra(G, source, target, weight=weight) with node ids.
+        """
+        index = self.index
+        s = index[source]
+        t = index[target]
+        dist, pred_edge = self.dijkstra(s, t, weight=weight, weights=weights)
+        if t not in dist:
+            raise nx.NetworkXNoPath(f'No path to {target}.')
+        return dist[t], self.to_node_ids(self.path_to(pred_edge, t))
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import networkx as nx
+import numpy as np
+import osmnx as ox
+
+from util.CompactGraph import CompactGraph
+
+# bump this whenever the arrays or their meaning change
+_SNAPSHOT_VERSION = 1
+_ARRAYS = ('node_ids', 'offsets', 'targets', 'length', 'travel_time', 'highway_rank', 'osmid')
+_META_FILE_NAME = 'meta.json'
+
+
+def snapshot_path(graphml_file_path: str, weight: str) -> str:
+    """
+    Directory of the binary snapshot of a graphml file, collapsed to a digraph by the given weight.
+    """
+    return os.path.join(os.path.splitext(graphml_file_path)[0] + '.snapshot', weight)
+
+
+def _checksum(file_path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _source_meta(graphml_file_path: str, checksum: str = None) -> dict:
+    stat = os.stat(graphml_file_path)
+    return {'version': _SNAPSHOT_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha1': checksum if checksum is not None else _checksum(graphml_file_path)}
+
+
+def _read_meta(path: str) -> dict:
+    meta_path = os.path.join(path, _META_FILE_NAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as meta_file:
+        try:
+            return json.load(meta_file)
+        except ValueError:
+            return None
+
+
+def _write_meta(path: str, meta: dict) -> None:
+    tmp_path = os.path.join(path, _META_FILE_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(tmp_path, os.path.join(path, _META_FILE_NAME))
+
+
+def is_current(graphml_file_path: str, weight: str) -> bool:
+    """
+    Check if the snapshot belongs to the graphml file. Size and mtime are compared first, the checksum is only
+    computed if they differ, e.g. after the graphml was copied.
+    """
+    meta = _read_meta(snapshot_path(graphml_file_path, weight))
+    if meta is None or meta.get('version') != _SNAPSHOT_VERSION:
+        return False
+    stat = os.stat(graphml_file_path)
+    if meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if meta['size'] != stat.st_size or meta['sha1'] != _checksum(graphml_file_path):
+        return False
+    # same content, remember the new mtime so the checksum is not computed again
+    _write_meta(snapshot_path(graphml_file_path, weight), _source_meta(graphml_file_path, meta['sha1']))
+    return True
+
+
+def save_snapshot(cg: CompactGraph, graphml_file_path: str, weight: str, checksum: str = None) -> None:
+    path = snapshot_path(graphml_file_path, weight)
+    # write into a temporary directory and swap it in, so readers never see a half written snapshot
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp_path, name + '.npy'), np.ascontiguousarray(getattr(cg, name)))
+    meta = _source_meta(graphml_file_path, checksum)
+    meta['nodes'] = cg.number_of_nodes()
+    meta['edges'] = cg.number_of_edges()
+    _write_meta(tmp_path, meta)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(graphml_file_path: str, weight: str) -> CompactGraph:
+    path = snapshot_path(graphml_file_path, weight)
+    arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in _ARRAYS]
+    return CompactGraph(*arrays)
+
+
+def write_snapshots(G: nx.MultiDiGraph, graphml_file_path: str) -> None:
+    """
+    Write a snapshot for every weight from an osmnx graph that was saved to graphml_file_path.
+    """
+    checksum = _checksum(graphml_file_path)
+    for weight in ('length', 'travel_time'):
+        print('Saving graph snapshot:', snapshot_path(graphml_file_path, weight))
+        cg = CompactGraph.from_digraph(ox.get_digraph(G, weight=weight))
+        save_snapshot(cg, graphml_file_path, weight, checksum)
+
+
+def load_compact_graph(graphml_file_path: str, weight: str = 'length') -> CompactGraph:
+    """
+    Load the graphml file as a digraph collapsed by weight, like ox.get_digraph(G, weight=weight).
+
+    The graph comes from the memory-mapped snapshot. A missing or stale snapshot is rebuilt from the graphml.
+    """
+    if not is_current(graphml_file_path, weight):
+        print('Graph snapshot missing or stale, parsing graphml:', graphml_file_path)
+        G = ox.load_graphml(graphml_file_path)
+        cg = CompactGraph.from_digraph(ox.get_digraph(G, weight=weight))
+        save_snapshot(cg, graphml_file_path, weight)
+
+    start_time = time.time()
+    cg = load_snapshot(graphml_file_path, weight)
+    print('loaded graph snapshot in', time.time() - start_time, 's')
+    return cg
+
+
+def load_digraph(graphml_file_path: str, weight: str = 'length') -> nx.DiGraph:
+    """
+    Snapshot backed replacement for ox.get_digraph(ox.load_graphml(graphml_file_path), weight=weight).
+    """
+    return load_compact_graph(graphml_file_path, weight).to_digraph()
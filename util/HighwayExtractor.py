@@ -1,26 +1,53 @@
 import argparse
-import ast
 import csv
 
 import networkx as nx
-import osmnx as ox
+import numpy as np
+
+from util import PathParser
+
+HIGHWAY_HIERARCHY = {
+    'motorway': 7,
+    'trunk': 6,
+    'primary': 5,
+    'secondary': 4,
+    'tertiary': 3,
+    'unclassified': 2,
+    'residential': 1
+}
+
+# highway rank -> cleaned highway type, index 0 is used for edges without a known type
+HIGHWAY_TYPES = [None] + sorted(HIGHWAY_HIERARCHY, key=HIGHWAY_HIERARCHY.get)
 
 
 def _load_graph(graphml_path: str) -> nx.DiGraph:
     print("loading graph")
-    G = ox.load_graphml(graphml_path)
-    G = ox.get_digraph(G)
+    # imported here, GraphSnapshot depends on this module through CompactGraph
+    from util import GraphSnapshot
+    G = GraphSnapshot.load_digraph(graphml_path)
     print('G nodes', len(G.nodes()))
     print('G edges', len(G.edges()))
     return G
 
 
-def extract_highway_types_graphml(graphml_path: str, input_path: str, output_path: str):
-    G = _load_graph(graphml_path)
-    extract_highway_types_G(G, input_path, output_path)
+def _load_compact_graph(graphml_path: str):
+    print("loading graph")
+    from util import GraphSnapshot
+    cg = GraphSnapshot.load_compact_graph(graphml_path)
+    print('G nodes', cg.number_of_nodes())
+    print('G edges', cg.number_of_edges())
+    return cg
+
+
+def extract_highway_types_graphml(graphml_path: str, input_path: str, output_path: str, strict: bool = False):
+    cg = _load_compact_graph(graphml_path)
+    extract_highway_types_G(cg, input_path, output_path, strict)
 
 
-def extract_highway_types_G(G: nx.DiGraph, input_path: str, output_path: str):
+def extract_highway_types_G(cg, input_path: str, output_path: str, strict: bool = False):
+    """
+    Write the highway types and peaks of the paths in input_path. cg is the CompactGraph the paths were found on.
+    """
     with open(input_path, newline='', encoding='utf-8') as input_file, \
             open(output_path, 'w', newline='', encoding='utf-8') as output_file:
         fieldnames = ['TRIP_ID', 'PATH_ID', 'HIGHWAY_TYPES', 'HIGHWAY_PEAKS']
@@ -31,12 +58,12 @@ def extract_highway_types_G(G: nx.DiGraph, input_path: str, output_path: str):
         for row in input_csv:
             trip_id = row['TRIP_ID']
             path_id = row['PATH_ID'] if 'PATH_ID' in input_csv.fieldnames else None
-            path = row['NODE_PATH']
-            path = ast.literal_eval(path)
+            path = PathParser.parse_int_list(row['NODE_PATH'], strict).tolist()
 
-            highway_types = calculate_highway_types(G, path)
+            highway_ranks = calculate_highway_ranks(cg, path)
+            highway_types = [HIGHWAY_TYPES[rank] for rank in highway_ranks.tolist()]
 
-            highway_peaks = calculate_highway_peaks(highway_types)
+            highway_peaks = count_highway_peaks(highway_ranks)
             new_row = {'TRIP_ID': trip_id, 'PATH_ID': path_id, 'HIGHWAY_TYPES': highway_types,
                        'HIGHWAY_PEAKS': highway_peaks}
             w.writerow(new_row)
@@ -70,15 +97,7 @@ def calculate_highway_types(G: nx.DiGraph, path: list) -> list:
 
 
 def calculate_highway_peaks(highway_sequence) -> int:
-    highway_hierarchy = {
-        'motorway': 7,
-        'trunk': 6,
-        'primary': 5,
-        'secondary': 4,
-        'tertiary': 3,
-        'unclassified': 2,
-        'residential': 1
-    }
+    highway_hierarchy = HIGHWAY_HIERARCHY
     # priority_sequence = list(map(highway_hierarchy.get, highway_sequence))
     priority_sequence = []
     for h in highway_sequence:
@@ -101,12 +120,45 @@ def calculate_highway_peaks(highway_sequence) -> int:
     return peaks
 
 
-def extract_osmways_graphml(graphml_path: str, input_path: str, output_path: str):
+def highway_ranks(cg, edges: np.ndarray) -> np.ndarray:
+    """
+    Highway ranks of CompactGraph edge positions, looked up in the ranks the CompactGraph stores per edge. Edges
+    without a known type count as residential, like in clean_highway_types.
+    """
+    return np.maximum(cg.highway_rank[edges], HIGHWAY_HIERARCHY['residential'])
+
+
+def calculate_highway_ranks(cg, path: list) -> np.ndarray:
+    """
+    Highway ranks of the edges along a path of node ids.
+    """
+    return highway_ranks(cg, cg.edge_indices(path))
+
+
+def count_highway_peaks(highway_ranks: np.ndarray) -> int:
+    """
+    Same as calculate_highway_peaks on the ranks. A peak is a drop in rank after a rise, with runs of equal ranks
+    counting as one. The start of a path counts as a rise.
+
+    >>> count_highway_peaks(np.array([1, 3, 3, 2, 5, 1, 1]))
+    2
+    """
+    steps = np.sign(np.diff(highway_ranks.astype(np.int64)))
+    steps = steps[steps != 0]
+    if len(steps) == 0:
+        return 0
+    rises = np.empty(len(steps), dtype=bool)
+    rises[0] = True
+    rises[1:] = steps[:-1] > 0
+    return int(np.count_nonzero(rises & (steps < 0)))
+
+
+def extract_osmways_graphml(graphml_path: str, input_path: str, output_path: str, strict: bool = False):
     G = _load_graph(graphml_path)
-    extract_highway_types_G(G, input_path, output_path)
+    extract_osmways_G(G, input_path, output_path, strict)
 
 
-def extract_osmways_G(G, input_path: str, output_path: str):
+def extract_osmways_G(G, input_path: str, output_path: str, strict: bool = False):
     with open(input_path, newline='', encoding='utf-8') as input_file, \
             open(output_path, 'w', newline='', encoding='utf-8') as output_file:
         fieldnames = ['TRIP_ID', 'PATH_ID', 'NUM_TURNS']
@@ -117,8 +169,7 @@ def extract_osmways_G(G, input_path: str, output_path: str):
         for row in input_csv:
             trip_id = row['TRIP_ID']
             path_id = row['PATH_ID'] if 'PATH_ID' in input_csv.fieldnames else None
-            path = row['NODE_PATH']
-            path = ast.literal_eval(path)
+            path = PathParser.parse_int_list(row['NODE_PATH'], strict).tolist()
             turns = calculate_turns(G, path)
             new_row = {'TRIP_ID': trip_id, 'PATH_ID': path_id, 'NUM_TURNS': turns}
             w.writerow(new_row)
@@ -148,7 +199,8 @@ if __name__ == "__main__":
     parser.add_argument("graphml", help="Path to graphml file use.", type=str)
     parser.add_argument("input", help="Path to input file containing paths.", type=str)
     parser.add_argument("output", help="Path to output, where highway types are written.", type=str)
+    parser.add_argument("--strict", help="Reject malformed NODE_PATH rows.", action='store_true')
     args = parser.parse_args()
 
-    extract_highway_types_graphml(args.graphml, args.input, args.output)
-    # extract_osmways_graphml(args.graphml, args.input, args.output)
+    extract_highway_types_graphml(args.graphml, args.input, args.output, args.strict)
+    # extract_osmways_graphml(args.graphml, args.input, args.output, args.strict)
@@ -0,0 +1,42 @@
+import multiprocessing
+from collections import deque
+
+# function run by the worker processes. It is set before the pool is forked, so workers inherit it together with
+# the graph it refers to (copy-on-write, or shared pages for memory-mapped snapshots) and only trips are pickled.
+_task = None
+
+
+def _run_task(item):
+    return _task(item)
+
+
+def imap_ordered(task, items, workers: int, chunksize: int = 1, max_pending: int = None):
+    """
+    Apply task to every item and yield the results in input order.
+
+    With more than one worker the items are distributed over a pool of forked processes. The results are
+    identical to the serial run, only the order in which they are computed differs. With max_pending, at most
+    that many items are taken from items before their results are consumed, e.g. to stream large inputs.
+    """
+    global _task
+    if workers <= 1:
+        for item in items:
+            yield task(item)
+        return
+
+    _task = task
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            if max_pending is None:
+                for result in pool.imap(_run_task, items, chunksize):
+                    yield result
+                return
+            pending = deque()
+            for item in items:
+                if len(pending) >= max_pending:
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(_run_task, (item,)))
+            while pending:
+                yield pending.popleft().get()
+    finally:
+        _task = None
@@ -0,0 +1,84 @@
+import re
+
+import numpy as np
+
+# Parsers for the bracketed lists written by csv.DictWriter, e.g. NODE_PATH '[1, 2, 3]', NODE_SET '{1, 2}',
+# CPATH '[(1, 2), (2, 3)]' and POLYLINE '[[-8.61, 41.14], [-8.62, 41.15]]'. They split the text instead of
+# evaluating it as python. In strict mode the whole text is validated first and malformed rows raise a ValueError.
+
+_INT = r'\s*-?\d+\s*'
+_FLOAT = r'\s*-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*'
+
+
+def _list_pattern(item: str, open_bracket: str, close_bracket: str):
+    return re.compile(r'\s*' + open_bracket + r'(?:' + item + r'(?:,' + item + r')*)?' + close_bracket + r'\s*')
+
+
+def _pair_pattern(number: str, open_bracket: str, close_bracket: str) -> str:
+    return r'\s*' + open_bracket + number + ',' + number + close_bracket + r'\s*'
+
+
+_INT_LIST = _list_pattern(_INT, r'\[', r'\]')
+_INT_SET = _list_pattern(_INT, r'\{', r'\}')
+_INT_PAIRS = _list_pattern(_pair_pattern(_INT, r'\(', r'\)'), r'\[', r'\]')
+_FLOAT_PAIRS = _list_pattern(_pair_pattern(_FLOAT, r'\[', r'\]'), r'\[', r'\]')
+
+_BRACKETS = str.maketrans('[](){}', '      ')
+
+
+def _check(pattern, text: str, strict: bool) -> None:
+    if strict and pattern.fullmatch(text) is None:
+        raise ValueError('Malformed list: ' + text[:100])
+
+
+def _split(text: str, dtype, width: int = 1) -> np.ndarray:
+    body = text.translate(_BRACKETS).strip()
+    if body == '':
+        values = np.empty(0, dtype=dtype)
+    else:
+        values = np.array(body.split(','), dtype=dtype)
+    if width > 1:
+        if len(values) % width != 0:
+            raise ValueError('Malformed list: ' + text[:100])
+        values = values.reshape(-1, width)
+    return values
+
+
+def parse_int_list(text: str, strict: bool = False) -> np.ndarray:
+    """
+    Parse a list of ints like '[1, 2, 3]' into an int64 array.
+
+    >>> parse_int_list('[1, 2, 3]')
+    array([1, 2, 3])
+    """
+    _check(_INT_LIST, text, strict)
+    return _split(text, np.int64)
+
+
+def parse_int_set(text: str, strict: bool = False) -> np.ndarray:
+    """
+    Parse a set of ints like '{1, 2}' or 'set()' into an int64 array, in the order they are written.
+
+    >>> parse_int_set('set()')
+    array([], dtype=int64)
+    """
+    if text.strip() == 'set()':
+        return np.empty(0, dtype=np.int64)
+    _check(_INT_SET, text, strict)
+    return _split(text, np.int64)
+
+
+def parse_int_pairs(text: str, strict: bool = False) -> np.ndarray:
+    """
+    Parse a list of int tuples like '[(1, 2), (2, 3)]' into an int64 array of shape (n, 2).
+    """
+    _check(_INT_PAIRS, text, strict)
+    return _split(text, np.int64, 2)
+
+
+def parse_float_pairs(text: str, strict: bool = False) -> np.ndarray:
+    """
+    Parse a list of coordinates like '[[-8.61, 41.14], [-8.62, 41.15]]' into a float64 array of shape (n, 2).
+    """
+    _check(_FLOAT_PAIRS, text, strict)
+    return _split(text, np.float64, 2)
@@ -0,0 +1,295 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from util import PathParser
+
+# bump this whenever the columns or their meaning change
+_STORE_VERSION = 1
+_META_FILE_NAME = 'meta.json'
+_STORE_DIR_NAME = 'paths'
+
+# per trip: trip id, the range of its paths and optionally its start and end node. per path: trip id, path id, the
+# range of its nodes and optionally its runtime and the range of its via nodes. offsets start with 0, so the rows
+# of i are offsets[i]:offsets[i + 1]
+_COLUMNS = {'trip_ids': 'int64', 'trip_offsets': 'int64', 'path_trip_ids': 'int64', 'path_ids': 'int64',
+            'node_offsets': 'int64', 'nodes': 'int64'}
+_RUNTIME_COLUMNS = {'runtime': 'float64'}
+_VIA_NODES_COLUMNS = {'via_offsets': 'int64', 'via_nodes': 'int64'}
+_END_NODES_COLUMNS = {'start_nodes': 'int64', 'end_nodes': 'int64'}
+_OFFSET_COLUMNS = ('trip_offsets', 'node_offsets', 'via_offsets')
+
+
+def store_path(output_dir_path: str) -> str:
+    """
+    Directory of the path store of a prediction strategy, next to the per trip csv files it replaces.
+    """
+    return os.path.join(output_dir_path, _STORE_DIR_NAME)
+
+
+def exists(output_dir_path: str) -> bool:
+    return os.path.exists(os.path.join(store_path(output_dir_path), _META_FILE_NAME))
+
+
+class PathStoreWriter:
+    """
+    Appends the candidate paths of trips to a columnar path store.
+
+    Columns are buffered and written in bulk as raw binary arrays. The store only replaces an existing one once
+    it is closed, so readers never see a half written store.
+    """
+
+    def __init__(self, output_dir_path: str, runtime: bool = True, via_nodes: bool = False, end_nodes: bool = False,
+                 buffer_size: int = 1 << 20) -> None:
+        self._path = store_path(output_dir_path)
+        self._tmp_path = self._path + '.tmp'
+        if os.path.exists(self._tmp_path):
+            shutil.rmtree(self._tmp_path)
+        os.makedirs(self._tmp_path)
+
+        self._columns = dict(_COLUMNS)
+        if runtime:
+            self._columns.update(_RUNTIME_COLUMNS)
+        if via_nodes:
+            self._columns.update(_VIA_NODES_COLUMNS)
+        if end_nodes:
+            self._columns.update(_END_NODES_COLUMNS)
+        self._runtime = runtime
+        self._via_nodes = via_nodes
+        self._end_nodes = end_nodes
+        self._buffer_size = buffer_size
+
+        self._files = {name: open(os.path.join(self._tmp_path, name + '.bin'), 'wb') for name in self._columns}
+        self._buffers = {name: [0] if name in _OFFSET_COLUMNS else [] for name in self._columns}
+        self._trips = set()
+        self._num_paths = 0
+        self._num_nodes = 0
+        self._num_via_nodes = 0
+
+    def __enter__(self) -> 'PathStoreWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            for f in self._files.values():
+                f.close()
+
+    def add_trip(self, trip_id: int, paths: list, runtime: float = None, via_nodes: list = None,
+                 start_node: int = None, end_node: int = None) -> None:
+        """
+        Add the paths of a trip. via_nodes holds a list of via nodes for every path. start_node and end_node are
+        the nodes of the trip, they are stored by writers with end_nodes and kept for trips without paths.
+
+        A trip that is added again replaces the earlier paths for readers, like the per trip csv file that was
+        overwritten before.
+        """
+        if trip_id in self._trips:
+            print('Paths of trip', trip_id, 'were already added, keeping the last ones')
+        self._trips.add(trip_id)
+
+        buffers = self._buffers
+        for path_id, path in enumerate(paths):
+            buffers['path_trip_ids'].append(trip_id)
+            buffers['path_ids'].append(path_id)
+            buffers['nodes'].extend(path)
+            self._num_nodes += len(path)
+            buffers['node_offsets'].append(self._num_nodes)
+            if self._runtime:
+                buffers['runtime'].append(np.nan if runtime is None else runtime)
+            if self._via_nodes:
+                buffers['via_nodes'].extend(via_nodes[path_id])
+                self._num_via_nodes += len(via_nodes[path_id])
+                buffers['via_offsets'].append(self._num_via_nodes)
+        self._num_paths += len(paths)
+        buffers['trip_ids'].append(trip_id)
+        buffers['trip_offsets'].append(self._num_paths)
+        if self._end_nodes:
+            buffers['start_nodes'].append(start_node)
+            buffers['end_nodes'].append(end_node)
+
+        if len(buffers['nodes']) >= self._buffer_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        for name, values in self._buffers.items():
+            np.asarray(values, dtype=self._columns[name]).tofile(self._files[name])
+            values.clear()
+
+    def close(self) -> None:
+        self._flush()
+        for f in self._files.values():
+            f.close()
+
+        meta = {'version': _STORE_VERSION,
+                'columns': self._columns,
+                'trips': len(self._trips),
+                'paths': self._num_paths,
+                'nodes': self._num_nodes}
+        with open(os.path.join(self._tmp_path, _META_FILE_NAME), 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+
+        if os.path.exists(self._path):
+            shutil.rmtree(self._path)
+        os.replace(self._tmp_path, self._path)
+
+
+class PathStore:
+    """
+    Memory-mapped, read-only view of a path store with random access by trip id.
+    """
+
+    def __init__(self, output_dir_path: str) -> None:
+        path = store_path(output_dir_path)
+        with open(os.path.join(path, _META_FILE_NAME), encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('version') != _STORE_VERSION:
+            raise ValueError('Unsupported path store version: ' + str(meta.get('version')))
+
+        self.columns = {}
+        for name, dtype in meta['columns'].items():
+            file_path = os.path.join(path, name + '.bin')
+            # numpy can not memory-map empty files
+            if os.path.getsize(file_path) == 0:
+                self.columns[name] = np.empty(0, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(file_path, dtype=dtype, mode='r')
+        self.has_runtime = 'runtime' in self.columns
+        self.has_via_nodes = 'via_nodes' in self.columns
+        self.has_end_nodes = 'start_nodes' in self.columns
+        self._index = None
+
+    @property
+    def trip_ids(self) -> np.ndarray:
+        return self.columns['trip_ids']
+
+    @property
+    def index(self) -> dict:
+        # trip id -> trip row. a trip that was added more than once maps to its last row
+        if self._index is None:
+            self._index = {trip_id: i for i, trip_id in enumerate(self.trip_ids.tolist())}
+        return self._index
+
+    def __contains__(self, trip_id: int) -> bool:
+        return trip_id in self.index
+
+    def path_range(self, trip_id: int) -> (int, int):
+        i = self.index[trip_id]
+        trip_offsets = self.columns['trip_offsets']
+        return int(trip_offsets[i]), int(trip_offsets[i + 1])
+
+    def path_arrays(self, trip_id: int) -> list:
+        """
+        Node arrays of the paths of a trip, as views into the store.
+        """
+        start, end = self.path_range(trip_id)
+        node_offsets = self.columns['node_offsets'][start:end + 1].tolist()
+        nodes = self.columns['nodes']
+        return [nodes[a:b] for a, b in zip(node_offsets[:-1], node_offsets[1:])]
+
+    def paths(self, trip_id: int) -> list:
+        """
+        Paths of a trip as lists of node ids, in the order they were written.
+        """
+        return [path.tolist() for path in self.path_arrays(trip_id)]
+
+    def via_nodes(self, trip_id: int) -> list:
+        start, end = self.path_range(trip_id)
+        via_offsets = self.columns['via_offsets'][start:end + 1].tolist()
+        via_nodes = self.columns['via_nodes']
+        return [via_nodes[a:b].tolist() for a, b in zip(via_offsets[:-1], via_offsets[1:])]
+
+    def end_nodes(self, trip_id: int) -> (int, int):
+        """
+        Start and end node of a trip, for stores written with end_nodes.
+        """
+        i = self.index[trip_id]
+        return int(self.columns['start_nodes'][i]), int(self.columns['end_nodes'][i])
+
+    def runtimes(self, trip_id: int) -> list:
+        start, end = self.path_range(trip_id)
+        return self.columns['runtime'][start:end].tolist()
+
+
+class CsvPaths:
+    """
+    Reads paths from per trip csv files, e.g. results of an external k-shortest path library.
+    """
+
+    def __init__(self, output_dir_path: str, strict: bool = False) -> None:
+        self._output_dir_path = output_dir_path
+        self._strict = strict
+
+    def path_arrays(self, trip_id: int) -> list:
+        csv.field_size_limit(sys.maxsize)
+        input_path = os.path.join(self._output_dir_path, str(trip_id) + '.csv')
+        with open(input_path, newline='') as input_csv:
+            input_reader = csv.DictReader(input_csv, delimiter=',', quotechar='"')
+            return [PathParser.parse_int_list(row['NODE_PATH'], self._strict) for row in input_reader]
+
+    def paths(self, trip_id: int) -> list:
+        return [path.tolist() for path in self.path_arrays(trip_id)]
+
+
+def open_paths(output_dir_path: str, strict: bool = False):
+    """
+    Paths written by a prediction strategy, from the path store or the per trip csv files if there is no store.
+    strict applies to the csv files.
+    """
+    if exists(output_dir_path):
+        return PathStore(output_dir_path)
+    return CsvPaths(output_dir_path, strict)
+
+
+def export_csv(output_dir_path: str) -> None:
+    """
+    Write the path store as one csv file per trip, in the layout the prediction strategies used before.
+    """
+    store = PathStore(output_dir_path)
+    fieldnames = ['TRIP_ID', 'PATH_ID', 'START_NODE', 'END_NODE', 'NODE_PATH']
+    if store.has_via_nodes:
+        fieldnames.append('VIA_NODES')
+    if store.has_runtime:
+        fieldnames.append('RUNTIME')
+
+    for trip_id in store.index:
+        paths = store.paths(trip_id)
+        via_nodes = store.via_nodes(trip_id) if store.has_via_nodes else None
+        runtimes = store.runtimes(trip_id) if store.has_runtime else None
+        end_nodes = store.end_nodes(trip_id) if store.has_end_nodes else None
+
+        trip_output_file_name = os.path.join(output_dir_path, str(trip_id) + '.csv')
+        with open(trip_output_file_name, 'w', newline='', encoding='utf-8') as output_file:
+            w = csv.DictWriter(output_file, fieldnames=fieldnames, quotechar='"', quoting=csv.QUOTE_ALL)
+            w.writeheader()
+            for path_id, node_path in enumerate(paths):
+                new_row = {'TRIP_ID': trip_id, 'PATH_ID': path_id, 'NODE_PATH': node_path}
+                # stores without the trip's nodes were written by strategies that wrote the ends of the path
+                if end_nodes is not None:
+                    new_row['START_NODE'], new_row['END_NODE'] = end_nodes
+                elif len(node_path) > 0:
+                    new_row['START_NODE'], new_row['END_NODE'] = node_path[0], node_path[-1]
+                if via_nodes is not None:
+                    new_row['VIA_NODES'] = via_nodes[path_id]
+                # trips without a runtime are stored as nan and were written as empty fields
+                if runtimes is not None and not np.isnan(runtimes[path_id]):
+                    new_row['RUNTIME'] = runtimes[path_id]
+                w.writerow(new_row)
+
+
+if __name__ == "__main__":
+    description = '''
+    Export a path store to one csv file per trip.
+    Example: python -m util.PathStore datasets/porto/resources/vp/trajectories.csv
+    '''
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("output_dir", help="Output directory of the prediction strategy.", type=str)
+    args = parser.parse_args()
+
+    export_csv(args.output_dir)
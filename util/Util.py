@@ -1,8 +1,25 @@
 import fiona
 import networkx as nx
+import numpy as np
 import osmnx as ox
 import pandas as pd
 
+from util.CompactGraph import CompactGraph
+
+
+def build_speed_limit_lookup(speed_limits: pd.DataFrame) -> dict:
+    """
+    Map (source, target) to the speed limit in km/h. If there are multiple speed limits for an edge, the first one
+    in the file wins.
+
+    >>> speed_limits = pd.DataFrame({'source': [1, 1, 2], 'target': [2, 2, 3], 'speed_kph': [50.0, 30.0, 90.0]})
+    >>> build_speed_limit_lookup(speed_limits)
+    {(1, 2): 50.0, (2, 3): 90.0}
+    """
+    first = speed_limits.drop_duplicates(subset=['source', 'target'], keep='first')
+    keys = zip(first['source'].astype('int64').tolist(), first['target'].astype('int64').tolist())
+    return dict(zip(keys, first['speed_kph'].tolist()))
+
 
 def load_graph(path_edges, path_nodes, path_speed_limits) -> nx.MultiDiGraph:
     G = nx.DiGraph()
@@ -10,18 +27,18 @@ def load_graph(path_edges, path_nodes, path_speed_limits) -> nx.MultiDiGraph:
     with fiona.open(path_edges) as edge_features, fiona.open(path_nodes) as node_features, \
             open(path_speed_limits, newline='', encoding='utf-8') as speed_limits_file:
 
-        speed_limits = pd.read_csv(speed_limits_file)
-        # sl = speed_limits.loc[speed_limits['osm_id'] == 4256491]
-        # print(type(sl))
-        # print(sl)
-        # print(sl['kmh'])
+        # one keyed lookup instead of filtering the whole data frame for every edge
+        speed_limits = build_speed_limit_lookup(pd.read_csv(speed_limits_file))
 
+        nodes = []
         for node in node_features:
             properties = node['properties']
             geometry = node['geometry']
             id = properties['osmid']
-            G.add_node(id, properties=properties, geometry=geometry)
+            nodes.append((id, {'properties': properties, 'geometry': geometry}))
+        G.add_nodes_from(nodes)
 
+        edges = []
         for edge in edge_features:
             properties = edge['properties']
             geometry = edge['geometry']
@@ -32,9 +49,8 @@ def load_graph(path_edges, path_nodes, path_speed_limits) -> nx.MultiDiGraph:
             weight_distance = properties['length']
             weight_distance = float(weight_distance)
 
-            speed_limit = speed_limits.loc[speed_limits['source'].eq(int(u)) & speed_limits['target'].eq(int(v))]
             # TODO: if there are multiple speed limits we just take the first. is there a better solution?
-            speed_limit = list(speed_limit['speed_kph'])[0]
+            speed_limit = speed_limits[(int(u), int(v))]
             # speed limit in km/h convert to m/s
             speed_limit = speed_limit / 3.6
 
@@ -46,36 +62,57 @@ def load_graph(path_edges, path_nodes, path_speed_limits) -> nx.MultiDiGraph:
             # print('speed limit:', speed_limit)
             # print('duration:', weight_duration)
             # print()
-            G.add_edge(u, v, weight_duration=weight_duration, weight_distance=weight_distance, fid=fid,
-                       geometry=geometry,
-                       properties=properties)
+            edges.append((u, v, {'weight_duration': weight_duration, 'weight_distance': weight_distance, 'fid': fid,
+                                 'geometry': geometry, 'properties': properties}))
+        G.add_edges_from(edges)
         return G
 
 
-def get_furthest_node_index(G: nx.DiGraph, path: list, max_distance: float, iterator: iter) -> int:
-    dist_sum = 0
-    for i in iterator:
-        dist = nx.path_weight(G, path[i - 1: i + 1], weight='travel_time')
-        dist_sum += dist
-        # print('i', i, 'p', path[i - 1: i + 1], 'dist', dist, 'dist_sum', dist_sum)
-        if dist_sum > max_distance:
-            break
-    return i
-
-
-def is_locally_optimal(G: nx.DiGraph, path: list, alpha: float) -> bool:
+def _cumulative_sums(weights: np.ndarray) -> np.ndarray:
+    # np.cumsum adds in order, so the sums equal those of a loop along the path
+    return np.cumsum(weights)
+
+
+def get_furthest_node_index(travel_times: np.ndarray, max_distance: float, reverse: bool = False) -> int:
+    """
+    Index of the first node whose travel time from the start of the path exceeds max_distance, or from the end
+    of the path with reverse=True. If no node does, the last node before the other end. travel_times holds the
+    travel times of the edges along the path.
+    """
+    num_edges = len(travel_times)
+    if reverse:
+        k = int(np.searchsorted(_cumulative_sums(travel_times[::-1]), max_distance, side='right'))
+        return num_edges - k if k < num_edges else 1
+    k = int(np.searchsorted(_cumulative_sums(travel_times), max_distance, side='right'))
+    return min(k + 1, num_edges)
+
+
+def is_locally_optimal(G: nx.DiGraph, path: list, alpha: float, cg: CompactGraph = None,
+                       travel_times: np.ndarray = None) -> bool:
+    """
+    Check if the subpath between the nodes alpha times the path's travel time away from both ends is a fastest
+    path. With cg, the search for a faster path stops once it exceeds the travel time of the subpath.
+    travel_times holds the travel times of the edges along path, if they are known already.
+    """
     if len(path) < 2:
         return None
 
-    reference_distance = nx.path_weight(G, path, weight='travel_time')
+    if travel_times is None and cg is not None:
+        travel_times = cg.travel_time[cg.edge_indices(path)]
+    elif travel_times is None:
+        travel_times = np.fromiter((G[u][v]['travel_time'] for u, v in zip(path[:-1], path[1:])), dtype=np.float64,
+                                   count=len(path) - 1)
+    reference_distance = float(_cumulative_sums(travel_times)[-1])
     t_distance = reference_distance * alpha
 
-    u_index = get_furthest_node_index(G, path, t_distance, range(1, len(path)))
-    w_index = get_furthest_node_index(G, path, t_distance, range(len(path) - 1, 0, -1))
+    u_index = get_furthest_node_index(travel_times, t_distance)
+    w_index = get_furthest_node_index(travel_times, t_distance, reverse=True)
 
     local_path = path[u_index: w_index]
     if len(local_path) < 2:
         return None
+    if cg is not None:
+        return cg.is_shortest_path(local_path, weight='travel_time')
     local_shortest_path = nx.shortest_path(G, local_path[0], local_path[-1], weight='travel_time')
     return local_shortest_path == local_path
 